@@ -4,43 +4,74 @@
 """Factory برای ساخت Agent یا CodeAgent با تنظیمات امن‌تر.
 
 تغییرات کلیدی:
-- بارگذاری مدل از طریق AIBrain
+- بارگذاری مدل از طریق AIBrain (با کش مشترک بین فراخوانی‌ها)
 - حذف مقادیر حساس هاردکد شده؛ مقدار session key از متغیر محیطی خوانده می‌شود
 - مسیرهای فایل به صورت قابل پیکربندی و امن قرار می‌گیرند
+- SESSION_KEY و مسیر data فقط یک بار در هر پردازه (در اولین ساخت Agent) خوانده می‌شوند
+- browser_use به صورت lazy ایمپورت می‌شود تا ایمپورت core سبک بماند
 """
 
 from __future__ import annotations
 
+import functools
 import os
 from pathlib import Path
-from typing import Any
+from typing import TYPE_CHECKING, Any, List, Optional, Tuple
 
-from browser_use import Agent, CodeAgent
-from .ai_brain import AIBrain
+from .ai_brain import get_model
 from .browser_core import create_browser
 
+if TYPE_CHECKING:
+    from browser_use import Agent, CodeAgent
 
-def create_agent(task: str, mode: str = "browser") -> Agent | CodeAgent:
+
+def __getattr__(name: str) -> Any:
+    """ایمپورت lazy کلاس‌های browser_use (PEP 562) برای سازگاری با `from core.agent_core import Agent`."""
+    if name in ("Agent", "CodeAgent"):
+        from browser_use import Agent, CodeAgent
+
+        globals().update(Agent=Agent, CodeAgent=CodeAgent)
+        return globals()[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+@functools.lru_cache(maxsize=1)
+def _agent_settings() -> Tuple[Optional[str], Tuple[str, ...]]:
+    """(session key، مسیرهای مجاز) را یک بار می‌خواند.
+
+    این کار عمداً در اولین فراخوانی (نه هنگام import) انجام می‌شود تا مقادیر .env که
+    main.py پس از import ماژول‌ها بارگذاری می‌کند در نظر گرفته شوند.
+    """
+    # مقدار session key را از متغیر محیطی بخوانید؛ اگر تنظیم نشده، از None استفاده می‌شود
+    session_key = os.getenv("SESSION_KEY") or None
+    # مسیرهای مجاز برای agent (در صورت نیاز، می‌توانید تنظیمات را از فایل یا env بخوانید)
+    available_paths = (str(Path("./data").resolve()),)
+    return session_key, available_paths
+
+
+def create_agent(task: str, mode: str = "browser", *, browser: Any = None) -> Agent | CodeAgent:
     """یک Agent یا CodeAgent را بر اساس حالت (mode) می‌سازد.
 
     پارامترها:
     - task: متن کار برای عامل
     - mode: 'browser' یا 'code'
+    - browser: Browser موجود (مثلاً از AgentPool) برای حالت browser؛ اگر None باشد Browser جدید ساخته می‌شود
     """
+    # browser_use (و Playwright) فقط هنگام ساخت اولین Agent بارگذاری می‌شود
+    from browser_use import Agent, CodeAgent
 
-    ai_brain = AIBrain()
-    # تعیین مدل بر اساس نوع agent
-    llm = ai_brain.get_model("browse" if mode == "browser" else "analyze")
+    # تعیین مدل بر اساس نوع agent؛ مدل‌ها بین فراخوانی‌ها کش می‌شوند
+    llm = get_model("browse" if mode == "browser" else "analyze")
 
-    browser = create_browser() if mode == "browser" else None
+    if mode != "browser":
+        browser = None
+    elif browser is None:
+        browser = create_browser()
 
     agent_class = CodeAgent if mode == "code" else Agent
 
-    # مقدار session key را از متغیر محیطی بخوانید؛ اگر تنظیم نشده، از None استفاده می‌شود
-    session_key = os.getenv("SESSION_KEY")
-
-    # مسیرهای مجاز برای agent (در صورت نیاز، می‌توانید تنظیمات را از فایل یا env بخوانید)
-    available_paths = [str(Path("./data").resolve())]
+    session_key, paths = _agent_settings()
+    available_paths: List[str] = list(paths)
 
     # اگر agent_class یک ماژول است (مثلاً به‌خاطر import اشتباه)، تلاش کنیم کلاس مناسب را از درون ماژول استخراج کنیم
     if not callable(agent_class):
@@ -0,0 +1,156 @@
+# SPDX-License-Identifier: NOASSERTION
+# Copyright (c) 2025 Shahin
+
+"""Pool ساده برای استفادهٔ مجدد از نشست‌های مرورگر بین تسک‌ها.
+
+پرهزینه‌ترین بخش ساخت Agent در حالت browser، ساخت و راه‌اندازی Browser است؛ مدل LLM از قبل
+بین فراخوانی‌ها کش می‌شود. برای هر تسک یک Agent تازه ساخته می‌شود تا تاریخچه و پیام‌های
+تسک قبلی به تسک مستقل بعدی نشت نکند، اما Browser (با keep_alive=True) در pool می‌ماند و به
+Agent بعدی داده می‌شود. Agentهای حالت‌های دیگر (مثل CodeAgent) مرورگری از pool نمی‌گیرند.
+مرورگرهایی که بیش از max_idle_seconds بیکار بمانند توسط cleaner بسته و حذف می‌شوند.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import inspect
+import logging
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, List, Optional
+
+from .agent_core import create_agent
+from .browser_core import create_browser
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(slots=True)
+class _PooledBrowser:
+    """یک Browser نگهداری‌شده در pool همراه با شمار استفاده و زمان آغاز بیکاری."""
+
+    browser: Any
+    uses: int = 0
+    idle_since: float = 0.0
+
+
+class AgentPool:
+    """ساخت Agent تازه برای هر تسک با قرض گرفتن Browser از pool.
+
+    تنظیمات دیگری که روی ساخت Browser و Agent اثر دارند (SESSION_KEY، BROWSER_HEADLESS) در هر
+    پردازه یک بار خوانده می‌شوند، پس مرورگرهای pool همیشه قابل جایگزینی‌اند.
+
+    پارامترها:
+    - max_idle_seconds: حداکثر زمان بیکاری یک Browser در pool پیش از بسته شدن
+    - max_uses: حداکثر تعداد تسک‌هایی که روی یک Browser اجرا می‌شود؛ تب‌ها و کوکی‌ها بین
+      تسک‌ها باقی می‌مانند، پس پس از این تعداد Browser بسته و از نو ساخته می‌شود
+    """
+
+    def __init__(self, *, max_idle_seconds: float = 300.0, max_uses: int = 5) -> None:
+        self._idle: List[_PooledBrowser] = []
+        self._lock = asyncio.Lock()
+        self._max_idle = max(0.0, float(max_idle_seconds))
+        self._max_uses = max(1, int(max_uses))
+        self._cleaner: Optional[asyncio.Task[None]] = None
+
+    @asynccontextmanager
+    async def lease(self, task: str, mode: str) -> AsyncIterator[Any]:
+        """یک Agent تازه برای مدت اجرای تسک می‌دهد؛ Browser آن پس از پایان به pool برمی‌گردد."""
+        entry = await self._take_browser() if mode == "browser" else None
+        try:
+            # ساخت Agent (و Browser) ممکن است blocking باشد؛ در thread جدا اجرا می‌شود
+            # تا حلقهٔ asyncio برای تسک‌های هم‌زمان دیگر آزاد بماند
+            agent = await asyncio.to_thread(
+                create_agent, task, mode, browser=entry.browser if entry is not None else None
+            )
+        except BaseException:
+            if entry is not None:
+                await self._return_browser(entry)
+            raise
+
+        try:
+            yield agent
+        except BaseException:
+            await _call(agent, "close")
+            if entry is not None:
+                # وضعیت مرورگر پس از خطا نامعلوم است؛ به pool برنمی‌گردد
+                await _call(entry.browser, "kill")
+            raise
+        await _call(agent, "close")
+        if entry is not None:
+            await self._return_browser(entry)
+
+    async def _take_browser(self) -> _PooledBrowser:
+        """برداشتن یک Browser آزاد از pool یا ساخت Browser جدید."""
+        async with self._lock:
+            entry = self._idle.pop() if self._idle else None
+        if entry is None:
+            entry = _PooledBrowser(await asyncio.to_thread(create_browser))
+        else:
+            logger.debug("Browser az pool estefade shod")
+        entry.uses += 1
+        return entry
+
+    async def _return_browser(self, entry: _PooledBrowser) -> None:
+        """برگرداندن Browser به pool (یا بستن آن اگر به سقف استفاده رسیده باشد)."""
+        if entry.uses >= self._max_uses:
+            await _call(entry.browser, "kill")
+            return
+        entry.idle_since = time.monotonic()
+        async with self._lock:
+            self._idle.append(entry)
+
+    async def prune(self) -> None:
+        """بستن مرورگرهایی که بیش از max_idle_seconds بیکار مانده‌اند."""
+        deadline = time.monotonic() - self._max_idle
+        async with self._lock:
+            expired = [e for e in self._idle if e.idle_since <= deadline]
+            self._idle = [e for e in self._idle if e.idle_since > deadline]
+        for entry in expired:
+            await _call(entry.browser, "kill")
+
+    def start_cleaner(self, interval: float = 60.0) -> None:
+        """راه‌اندازی coroutine پاکسازی دوره‌ای (در صورت اجرا نبودن).
+
+        cleaner فقط وقتی اجرا می‌شود که حلقهٔ asyncio آزاد باشد؛ فراخواننده نباید حلقه را
+        (مثلاً با input() همگام) مسدود نگه دارد.
+        """
+        if self._cleaner is not None and not self._cleaner.done():
+            return
+
+        async def _cleaner_loop() -> None:
+            while True:
+                await asyncio.sleep(interval)
+                try:
+                    await self.prune()
+                except Exception:
+                    logger.exception("Khata dar pakhsazi agent pool")
+
+        self._cleaner = asyncio.create_task(_cleaner_loop())
+
+    async def close(self) -> None:
+        """توقف cleaner و بستن تمام مرورگرهای موجود در pool."""
+        if self._cleaner is not None:
+            self._cleaner.cancel()
+            self._cleaner = None
+        async with self._lock:
+            entries, self._idle = self._idle, []
+        for entry in entries:
+            await _call(entry.browser, "kill")
+
+
+async def _call(obj: Any, name: str) -> None:
+    """فراخوانی متد بستن (close/kill) در صورت وجود؛ خطاها فقط لاگ می‌شوند."""
+    method = getattr(obj, name, None)
+    if not callable(method):
+        return
+    try:
+        result = method()
+        if inspect.isawaitable(result):
+            await result
+    except Exception:
+        logger.exception("Khata dar bastan %s", type(obj).__name__)
+
+
+__all__ = ["AgentPool"]
@@ -9,44 +9,86 @@
 
 from __future__ import annotations
 
+import importlib
 import os
 import logging
-from typing import Any
+import threading
+from typing import Any, Callable, ClassVar, NamedTuple, Optional
 
 logger = logging.getLogger(__name__)
 
 
+class _ModelSpec(NamedTuple):
+    """مشخصات ساخت یک مدل: محل کلاس و متغیرهای محیطی مربوط به آن."""
+
+    module: str
+    cls_name: str
+    model_env: Optional[str] = None
+    model_default: Optional[str] = None
+    temperature_default: Optional[str] = None
+
+
+# جدول dispatch از نام منطقی مدل به مشخصات ساخت آن
+_SPEC: dict[str, _ModelSpec] = {
+    "reasoning": _ModelSpec("browser_use.llm.google.chat", "ChatGoogle",
+                            "GOOGLE_REASONING_MODEL", "gemini-2.5-flash", "0.5"),
+    "browser_use": _ModelSpec("browser_use.llm.browser_use.chat", "ChatBrowserUse"),
+    "fast": _ModelSpec("browser_use.llm.groq.chat", "ChatGroq", "GROQ_MODEL", "groq-1", "0.7"),
+    "normal": _ModelSpec("browser_use.llm.openai.chat", "ChatOpenAI",
+                         "OPENAI_MODEL", "openai/gpt-4o-mini", "0"),
+}
+
+# نگاشت منظور (purpose) به نام منطقی مدل
+_PURPOSE_TO_MODEL: dict[str, str] = {
+    "analyze": "reasoning",
+    "browse": "browser_use",
+    "realtime": "fast",
+}
+
+# کلاس‌های سازندهٔ مدل پس از اولین import اینجا نگه داشته می‌شوند
+_CTOR_CACHE: dict[str, Callable[..., Any]] = {}
+
+
+def _resolve_ctor(name: str) -> Callable[..., Any]:
+    """import ماژول مدل و برداشتن کلاس آن؛ فقط یک بار برای هر نام انجام می‌شود."""
+    ctor = _CTOR_CACHE.get(name)
+    if ctor is None:
+        spec = _SPEC[name]
+        ctor = getattr(importlib.import_module(spec.module), spec.cls_name)
+        _CTOR_CACHE[name] = ctor
+    return ctor
+
+
+def _env_fingerprint(name: str) -> tuple[Optional[str], ...]:
+    """مقادیر فعلی متغیرهای محیطی مؤثر بر ساخت مدل (برای کلید کش)."""
+    spec = _SPEC[name]
+    if spec.model_env is None:
+        return ()
+    return (os.getenv(spec.model_env), os.getenv("MODEL_TEMPERATURE"))
+
+
 class AIBrain:
     """کلاس برای مدیریت و انتخاب مدل مناسب بر اساس منظور (purpose).
 
     روش کار: مدل‌ها هنگام نیاز ساخته می‌شوند تا زمان شروع برنامه سبک بماند.
+    کش مدل‌ها در سطح کلاس نگه داشته می‌شود تا همهٔ نمونه‌های AIBrain (مثلاً در هر
+    فراخوانی create_agent) یک کلاینت LLM مشترک برای هر منظور داشته باشند.
     """
 
-    def __init__(self) -> None:
-        self._models: dict[str, Any] = {}
+    # کلید کش: (نام منطقی مدل، مقادیر متغیرهای محیطی مؤثر) تا تغییر env کش را باطل کند
+    _models: ClassVar[dict[tuple[str, tuple[Optional[str], ...]], Any]] = {}
+    _models_lock: ClassVar[threading.Lock] = threading.Lock()
 
     def _load_model(self, name: str) -> Any:
         """بارگذاری مدل با نام منطقی. این توابع importهای سنگین را محصور می‌کند."""
         try:
-            if name == "reasoning":
-                from browser_use.llm.google.chat import ChatGoogle
-
-                model = ChatGoogle(model=os.getenv("GOOGLE_REASONING_MODEL", "gemini-2.5-flash"),
-                                   temperature=float(os.getenv("MODEL_TEMPERATURE", "0.5")))
-            elif name == "browser_use":
-                from browser_use.llm.browser_use.chat import ChatBrowserUse
-
-                model = ChatBrowserUse()
-            elif name == "fast":
-                from browser_use.llm.groq.chat import ChatGroq
-
-                model = ChatGroq(model=os.getenv("GROQ_MODEL", "groq-1"),
-                                  temperature=float(os.getenv("MODEL_TEMPERATURE", "0.7")))
+            spec = _SPEC[name]
+            ctor = _resolve_ctor(name)
+            if spec.model_env is None:
+                model = ctor()
             else:
-                from browser_use.llm.openai.chat import ChatOpenAI
-
-                model = ChatOpenAI(model=os.getenv("OPENAI_MODEL", "openai/gpt-4o-mini"),
-                                    temperature=float(os.getenv("MODEL_TEMPERATURE", "0")))
+                model = ctor(model=os.getenv(spec.model_env, spec.model_default),
+                             temperature=float(os.getenv("MODEL_TEMPERATURE", spec.temperature_default)))
             logger.info("Model Hoshe Masnoii Load Shod: %s", name)
             return model
         except Exception as exc:
@@ -58,13 +100,22 @@ class AIBrain:
 
         مقادیر ممکن برای purpose: 'analyze', 'browse', 'realtime', یا پیش‌فرض.
         """
-        key = {
-            "analyze": "reasoning",
-            "browse": "browser_use",
-            "realtime": "fast",
-        }.get(purpose, "normal")
+        key = _PURPOSE_TO_MODEL.get(purpose, "normal")
+
+        cache_key = (key, _env_fingerprint(key))
+        model = self._models.get(cache_key)
+        if model is not None:
+            return model
+
+        with self._models_lock:
+            # بررسی دوباره: ممکن است thread دیگری همزمان مدل را ساخته باشد
+            model = self._models.get(cache_key)
+            if model is None:
+                model = self._load_model(key)
+                self._models[cache_key] = model
+        return model
 
-        if key not in self._models:
-            self._models[key] = self._load_model(key)
 
-        return self._models[key]
\ No newline at end of file
+def get_model(purpose: str) -> Any:
+    """دسترسی مستقیم به مدل کش‌شده بدون نیاز به ساخت AIBrain در فراخوانی‌کننده."""
+    return AIBrain().get_model(purpose)
\ No newline at end of file
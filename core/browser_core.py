@@ -4,34 +4,57 @@
 """ابزار کمکی برای ایجاد یک شیء Browser با تنظیمات پیش‌فرض قابل تنظیم.
 
 اینجا می‌توانیم تنظیمات مرتبط با مرورگر را از متغیرهای محیطی بخوانیم تا
-پیکربندی در محیط‌های مختلف ساده باشد.
+پیکربندی در محیط‌های مختلف ساده باشد. browser_use تنها هنگام ساخت اولین Browser
+ایمپورت می‌شود و BROWSER_HEADLESS فقط یک بار در هر پردازه خوانده می‌شود.
 """
 
 from __future__ import annotations
 
+import functools
 import os
-from typing import Any
-from browser_use import Browser
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    from browser_use import Browser
+
+
+def __getattr__(name: str) -> Any:
+    """ایمپورت lazy کلاس Browser (PEP 562)."""
+    if name == "Browser":
+        from browser_use import Browser
+
+        globals()["Browser"] = Browser
+        return Browser
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+_DEFAULT_WINDOW_SIZE = {"width": 1280, "height": 720}
+
+
+@functools.lru_cache(maxsize=1)
+def _default_headless() -> bool:
+    """مقدار پیش‌فرض headless از BROWSER_HEADLESS ("1" یا "true" به معنی headless)؛ یک بار خوانده می‌شود."""
+    return os.getenv("BROWSER_HEADLESS", "1").lower() not in ("0", "false", "no")
 
 
 def create_browser(*, headless: bool | None = None, window_size: dict | None = None) -> Browser:
     """یک نمونهٔ Browser با تنظیمات منطقی برمی‌گرداند.
 
     پارامترها:
-    - headless: اگر None باشد مقدار از متغیر محیطی BROWSER_HEADLESS خوانده می‌شود
+    - headless: اگر None باشد مقدار از متغیر محیطی BROWSER_HEADLESS (خوانده‌شده یک بار در هر پردازه) استفاده می‌شود
     - window_size: دیکشنری {'width': ..., 'height': ...}
     """
+    from browser_use import Browser
+
     if headless is None:
-        # مقدار پیش‌فرض از متغیر محیطی خوانده می‌شود ("1" یا "true" به معنی headless)
-        env_val = os.getenv("BROWSER_HEADLESS", "1").lower()
-        headless = env_val not in ("0", "false", "no")
+        headless = _default_headless()
 
     if window_size is None:
-        window_size = {"width": 1280, "height": 720}
+        window_size = dict(_DEFAULT_WINDOW_SIZE)
 
     # برگرداندن instance مرورگر با تنظیمات مشخص
     return Browser(
         headless=headless,
         keep_alive=True,
         window_size=window_size,
-    )
\ No newline at end of file
+    )
@@ -4,21 +4,56 @@
 """تنظیمات متمرکز لاگ‌گیری برای Sofware-AI
 
 این ماژول تابع setup_logging() رو ارائه می‌کنه که یه handler برای نمایش لاگ‌ها تو کنسول
-و یه handler چرخشی برای فایل (data/logs/app.log) تنظیم می‌کنه.
+و یه handler چرخشی برای فایل (data/logs/app.log) تنظیم می‌کنه. این handlerها پشت یه
+QueueListener توی thread جدا اجرا می‌شن تا نوشتن روی دیسک مسیر اجرای تسک‌ها رو کند نکنه.
 همچنین یه هوک استثنا نصب می‌کنه تا خطاهای گرفته‌نشده هم لاگ بشن.
 """
 from __future__ import annotations
 
+import atexit
+import functools
 import logging
 import logging.handlers
 import os
+import queue
 import sys
+import threading
 from pathlib import Path
 from typing import Optional
 
 
 DEFAULT_LOG_FILE = Path("data") / "logs" / "app.log"
 
+# listener فعال که handlerهای واقعی (کنسول و فایل) را در thread پس‌زمینه اجرا می‌کند
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def _stop_listener() -> None:
+    """توقف listener و خالی کردن صف لاگ‌ها (هنگام خروج یا پیکربندی مجدد)."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+
+
+atexit.register(_stop_listener)
+
+# آیا setup_logging قبلاً اجرا شده است؛ با _CONFIG_LOCK محافظت می‌شود
+_CONFIGURED = False
+_CONFIG_LOCK = threading.Lock()
+
+
+@functools.lru_cache(maxsize=None)
+def _resolve_level(value: str) -> int:
+    """تبدیل سطح لاگ (عدد یا نام مثل "debug") به عدد؛ مقدار نامعتبر -> INFO."""
+    try:
+        return int(value)
+    except ValueError:
+        level = getattr(logging, value.upper(), logging.INFO)
+        return level if isinstance(level, int) else logging.INFO
+
 
 def ensure_logs_dir(path: Path) -> None:
     path.parent.mkdir(parents=True, exist_ok=True)
@@ -29,36 +64,38 @@ def setup_logging(log_file: Optional[str] = None, level: Optional[int] = None) -
 
     - RotatingFileHandler -> فایل data/logs/app.log (حداکثر ۵ مگابایت، ۵ فایل بک‌آپ)
     - StreamHandler -> نمایش لاگ‌ها توی کنسول (stdout)
+    - روی root فقط یه QueueHandler قرار می‌گیره و دو handler بالا توسط QueueListener اجرا می‌شن
     - سطح لاگ‌گیری از آرگومان level میاد، اگر نبود از متغیر محیطی LOG_LEVEL 
       و اگر اونم نبود، پیش‌فرض INFO می‌شه
+    - اگر قبلاً پیکربندی شده باشه و log_file و level داده نشن، کاری انجام نمی‌شه
     """
+    global _CONFIGURED
+    with _CONFIG_LOCK:
+        # فراخوانی مجدد بدون آرگومان (مثلاً در reload نوت‌بوک) هزینه‌ای ندارد و فایل را دوباره باز نمی‌کند
+        if _CONFIGURED and log_file is None and level is None:
+            return
+        _configure(log_file, level)
+        _CONFIGURED = True
+
+
+def _configure(log_file: Optional[str], level: Optional[int]) -> None:
+    """ساخت handlerها و اتصال آن‌ها به root؛ فرض می‌شود _CONFIG_LOCK گرفته شده باشد."""
     log_path = Path(log_file) if log_file else DEFAULT_LOG_FILE
     ensure_logs_dir(log_path)
 
-    env_level = os.getenv("LOG_LEVEL")
     if level is None:
-        if env_level:
-            try:
-                level = int(env_level)
-            except Exception:
-                level_name = env_level.upper()
-                level = getattr(logging, level_name, logging.INFO)
-        else:
-            level = logging.INFO
+        env_level = os.getenv("LOG_LEVEL")
+        level = _resolve_level(env_level) if env_level else logging.INFO
 
     root = logging.getLogger()
     # اطمینان از اینکه level یک سطح معتبر لاگ‌گیری باشه (عدد یا اسم رشته‌ای)
-    lvl = level
-    if not isinstance(lvl, int):
-        try:
-            lvl = int(lvl)  # type: ignore[arg-type]
-        except Exception:
-            lvl = getattr(logging, str(lvl).upper(), logging.INFO)
+    lvl = level if isinstance(level, int) else _resolve_level(str(level))
     root.setLevel(lvl)
 
     # حذف تمام handler های قبلی تا هنگام راه‌اندازی مجدد، لاگ‌ها دوبار ثبت نشن 
     for h in list(root.handlers):
         root.removeHandler(h)
+    _stop_listener()
 
     formatter = logging.Formatter(
         "%(asctime)s | %(levelname)-7s | %(name)s:%(lineno)d | %(message)s"
@@ -68,7 +105,6 @@ def setup_logging(log_file: Optional[str] = None, level: Optional[int] = None) -
     ch = logging.StreamHandler(sys.stdout)
     ch.setLevel(lvl)
     ch.setFormatter(formatter)
-    root.addHandler(ch)
 
     # گرداننده فایل چرخشی
     fh = logging.handlers.RotatingFileHandler(
@@ -76,7 +112,14 @@ def setup_logging(log_file: Optional[str] = None, level: Optional[int] = None) -
     )
     fh.setLevel(lvl)
     fh.setFormatter(formatter)
-    root.addHandler(fh)
+
+    # صف بدون محدودیت؛ فراخوانی‌کنندهٔ logger فقط رکورد را در صف می‌گذارد
+    log_queue: queue.Queue[logging.LogRecord] = queue.Queue(-1)
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+
+    global _listener
+    _listener = logging.handlers.QueueListener(log_queue, ch, fh, respect_handler_level=True)
+    _listener.start()
 
 
 def install_exception_hook() -> None:
@@ -9,16 +9,102 @@
 
 from __future__ import annotations
 
+import functools
+import heapq
+import itertools
 import json
+import logging
+import re
 import sqlite3
+import sys
 import time
 import uuid
+from contextlib import contextmanager
 from dataclasses import dataclass, asdict
 from pathlib import Path
-from threading import Lock
-from typing import Any, Dict, Iterable, List, Optional, Tuple
+from threading import Condition, Lock, RLock, local
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
 
-@dataclass
+try:
+    import orjson
+except ImportError:  # orjson اختیاری است؛ در نبود آن از json استاندارد استفاده می‌شود
+    orjson = None  # type: ignore[assignment]
+
+logger = logging.getLogger(__name__)
+
+
+def _dumps(obj: Dict[str, Any]) -> str:
+    """سریال‌سازی metadata به JSON.
+
+    عمداً json استاندارد (با فاصله پس از ':' و ',') استفاده می‌شود نه orjson فشرده، تا قالب
+    ردیف‌های جدید با ردیف‌های موجود یکسان بماند و جستجوی LIKE روی metadata یکسان رفتار کند.
+    """
+    return json.dumps(obj, ensure_ascii=False, default=str)
+
+
+_SCALARS = (str, int, float, bool, type(None))
+
+
+@functools.lru_cache(maxsize=1024)
+def _flat_meta_cached(text: str) -> Optional[Tuple[Tuple[str, Any], ...]]:
+    """پارس JSON با کش (با orjson در صورت نصب بودن)؛ بسیاری از آیتم‌ها metadata یکسان دارند.
+
+    فقط metadata تخت (مقادیر scalar) به صورت tuple تغییرناپذیر کش می‌شود؛ برای metadata تو در تو
+    None برمی‌گردد تا هر فراخوانی نسخهٔ مستقل خودش را پارس کند.
+    """
+    data = _loads(text)
+    if all(isinstance(value, _SCALARS) for value in data.values()):
+        return tuple(data.items())
+    return None
+
+
+def _loads(text: str) -> Dict[str, Any]:
+    """پارس JSON با orjson در صورت نصب بودن."""
+    return orjson.loads(text) if orjson is not None else json.loads(text)
+
+
+def _decode_meta(text: Optional[str]) -> Dict[str, Any]:
+    """metadata ذخیره‌شده -> dict تازه؛ تغییر آن توسط فراخوانی‌کننده روی کش یا آیتم‌های دیگر اثری ندارد."""
+    if not text:
+        return {}
+    flat = _flat_meta_cached(text)
+    return dict(flat) if flat is not None else _loads(text)
+
+
+def _iter_items(cursor: sqlite3.Cursor) -> Iterator[MemoryItem]:
+    """ساخت تدریجی MemoryItem از ردیف‌های (id, content, metadata, created_at) یک cursor."""
+    for item_id, content, meta_json, created_at in cursor:
+        yield MemoryItem(id=item_id, content=content, metadata=_decode_meta(meta_json), created_at=created_at)
+
+
+# طول n-gram برای ایندکس معکوس حافظهٔ کوتاه‌مدت
+_NGRAM = 3
+
+
+def _ngrams(text: str) -> Set[str]:
+    """مجموعهٔ n-gramهای حرفی یک رشته (برای ایندکس جستجوی زیررشته)."""
+    return {text[i:i + _NGRAM] for i in range(len(text) - _NGRAM + 1)}
+
+
+def _escape_like(text: str) -> str:
+    """escape کردن کاراکترهای ویژهٔ LIKE (\\، %، _) برای استفاده با ESCAPE '\\'."""
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+_FTS_TOKEN_RE = re.compile(r"\w+")
+
+
+def _fts_query(query: str) -> str:
+    """تبدیل متن جستجو به عبارت MATCH در FTS5: هر توکن به صورت prefix و با AND ضمنی."""
+    return " ".join('"%s"*' % token.replace('"', '""') for token in _FTS_TOKEN_RE.findall(query))
+
+
+def _intern_keys(metadata: Dict[str, Any]) -> Dict[str, Any]:
+    """کپی metadata با کلیدهای intern‌شده تا کلیدهای تکراری ("type"، "mode"، ...) بین آیتم‌ها مشترک باشند."""
+    return {sys.intern(k) if isinstance(k, str) else k: v for k, v in metadata.items()}
+
+
+@dataclass(slots=True, frozen=True)
 class MemoryItem:
     id: str
     content: str
@@ -31,61 +117,120 @@ class ShortTermMemory:
 
     رفتار:
     - افزودن با ttl (ثانیه) یا بدون ttl (موقتی تا پاکسازی دستی)
-    - بازیابی و جستجو ساده بر اساس متن
+    - بازیابی و جستجو ساده بر اساس متن (با ایندکس معکوس trigram)
     - پاکسازی خودکار موارد منقضی
+
+    پارامترها:
+    - lock: قفل بازگشت‌پذیر (RLock) مشترک با فراخوانی‌کننده؛ اگر داده نشود یک RLock جدید ساخته می‌شود
     """
 
-    def __init__(self) -> None:
+    def __init__(self, lock: Optional[RLock] = None) -> None:
         self._store: Dict[str, MemoryItem] = {}
-        self._lock = Lock()
+        # trigram -> شناسهٔ آیتم‌هایی که در content یا metadata آن را دارند
+        self._index: Dict[str, Set[str]] = {}
+        # شناسه -> (content کوچک‌شده، metadata سریال‌شدهٔ کوچک‌شده)؛ یک بار در add ساخته می‌شود
+        self._lc: Dict[str, Tuple[str, str]] = {}
+        # heapهای (زمان، شناسه) برای یافتن قدیمی‌ترین و منقضی‌شده‌ها در O(log N)؛
+        # ورودی‌های آیتم‌های حذف‌شده به صورت lazy هنگام pop نادیده گرفته می‌شوند
+        self._created_heap: List[Tuple[float, str]] = []
+        self._expires_heap: List[Tuple[float, str]] = []
+        self._lock = lock if lock is not None else RLock()
 
     def add(self, content: str, ttl: Optional[float] = None, metadata: Optional[Dict[str, Any]] = None) -> MemoryItem:
         """افزودن یک آیتم به حافظهٔ کوتاه‌مدت. بازگشت MemoryItem ساخته‌شده."""
-        if metadata is None: 
-            metadata= {}
+        metadata = _intern_keys(metadata) if metadata else {}
         item_id = str(uuid.uuid4())
         now = time.time()
         expires_at = now + ttl if ttl is not None else None
         item = MemoryItem(id=item_id, content=content, metadata=metadata, created_at=now, expires_at=expires_at)
+        content_lc = content.lower()
+        meta_lc = _dumps(metadata).lower()
+        grams = _ngrams(content_lc) | _ngrams(meta_lc)
         with self._lock:
             self._store[item_id] = item
+            self._lc[item_id] = (content_lc, meta_lc)
+            for gram in grams:
+                self._index.setdefault(gram, set()).add(item_id)
+            heapq.heappush(self._created_heap, (now, item_id))
+            if expires_at is not None:
+                heapq.heappush(self._expires_heap, (expires_at, item_id))
         return item
+
+    def _remove_locked(self, item_id: str) -> Optional[MemoryItem]:
+        """حذف آیتم از store و ایندکس؛ فرض می‌شود lock از قبل گرفته شده باشد."""
+        item = self._store.pop(item_id, None)
+        if item is None:
+            return None
+        content_lc, meta_lc = self._lc.pop(item_id)
+        for gram in _ngrams(content_lc) | _ngrams(meta_lc):
+            postings = self._index.get(gram)
+            if postings is not None:
+                postings.discard(item_id)
+                if not postings:
+                    del self._index[gram]
+        self._compact_heaps_locked()
+        return item
+
+    def _compact_heaps_locked(self) -> None:
+        """بازسازی heapها وقتی ورودی‌های مرده بیش از حد شوند تا حافظه محدود بماند."""
+        bound = 2 * len(self._store) + 64
+        if len(self._created_heap) <= bound and len(self._expires_heap) <= bound:
+            return
+        self._created_heap = [(item.created_at, item_id) for item_id, item in self._store.items()]
+        self._expires_heap = [(item.expires_at, item_id) for item_id, item in self._store.items()
+                              if item.expires_at is not None]
+        heapq.heapify(self._created_heap)
+        heapq.heapify(self._expires_heap)
     
     def get(self, item_id: str) -> Optional[MemoryItem]:
-         """دریافت آیتم بر اساس شناسه. اگر منقضی شده باشد None بازمی‌گردد."""
-         with self._lock:
-             item = self._store.get(item_id)
-             if item is None: 
-                 return None
-             if item.expires_at is not None and time.time() > item.expires_at:
+        """دریافت آیتم بر اساس شناسه. اگر منقضی شده باشد None بازمی‌گردد."""
+        with self._lock:
+            item = self._store.get(item_id)
+            if item is None:
+                return None
+            expires_at = item.expires_at
+            if expires_at is not None and time.time() > expires_at:
                 # منقضی شده است؛ حذف و None برگردان
-                del self._store[item_id]
+                self._remove_locked(item_id)
                 return None
-                return item
-             
+            return item
+
     def query(self, keyword: str, limit: int = 10) -> List[MemoryItem]:
-        """جستجوی ساده بر اساس دربرداشتن keyword در content یا metadata (رشته‌ها)."""
-        keyword_lover = keyword.lower()
+        """جستجوی زیررشته‌ای keyword در content یا metadata.
+
+        اشتراک posting listهای trigramهای keyword نامزدها را می‌دهد و فقط
+        همان نامزدها با جستجوی زیررشته تأیید می‌شوند.
+        """
+        keyword_lower = keyword.lower()
         matches: List[MemoryItem] = []
         with self._lock:
             # پاکسازی موارد منقضی قبل از جستجو
             self._cleanup_locked()
-            for item in self._store.values():
-                if (keyword_lover in item.content.lower() or
-                    any(keyword_lover in str(v).lower() for v in item.metadata.values())):
-                    matches.append(item)
+            if len(keyword_lower) >= _NGRAM:
+                postings = [self._index.get(gram) for gram in _ngrams(keyword_lower)]
+                if any(p is None for p in postings):
+                    return matches
+                postings.sort(key=len)
+                if len(postings[0]) * 8 < len(self._store):
+                    candidates = set(postings[0]).intersection(*postings[1:])
+                    # حفظ ترتیب درج مانند اسکن کامل
+                    item_ids: Iterable[str] = sorted(candidates, key=lambda i: self._store[i].created_at)
+                else:
+                    # trigramهای پرتکرار: اشتراک و مرتب‌سازی از اسکن کامل با توقف زودهنگام گران‌تر است
+                    item_ids = self._store
+            else:
+                # keyword کوتاه‌تر از n-gram: اسکن کامل
+                item_ids = list(self._store)
+
+            for item_id in item_ids:
+                content_lc, meta_lc = self._lc[item_id]
+                if keyword_lower in content_lc or keyword_lower in meta_lc:
+                    matches.append(self._store[item_id])
                     if len(matches) >= limit:
                         break
 
-                else: 
-                    # جستجو در متادیتا به صورت رشته
-                    meta_str = json.dumps(item.metadata, ensure_ascii=False).lower()
-                    if keyword_lover in meta_str:
-                        matches.append(item)
-                        if len(matches) >= limit:
-                            break
-
         return matches
+
     def all_items(self) -> List[MemoryItem]:
         """بازگرداندن تمام آیتم‌های غیرمنقضی در حافظه."""
         with self._lock:
@@ -95,10 +240,12 @@ class ShortTermMemory:
     def _cleanup_locked(self) -> None:
         """حذف موارد منقضی شده؛ فرض می‌شود lock از قبل گرفته شده باشد."""
         now = time.time()
-        to_delete = [item_id for item_id, item in self._store.items()
-                     if item.expires_at is not None and now > item.expires_at]
-        for item_id in to_delete:
-            del self._store[item_id]
+        heap = self._expires_heap
+        while heap and heap[0][0] < now:
+            _, item_id = heapq.heappop(heap)
+            # ورودی ممکن است مربوط به آیتمی باشد که قبلاً حذف شده است
+            self._remove_locked(item_id)
+            heap = self._expires_heap
 
     def cleanup(self) -> None:
         """پاکسازی ایمن موارد منقضی‌شده."""
@@ -108,11 +255,47 @@ class ShortTermMemory:
     def pop_oldest(self) -> Optional[MemoryItem]:
         """برداشتن قدیمی‌ترین آیتم (برای مهاجرت به حافظهٔ بلندمدت)."""
         with self._lock:
-            if not self._store:
-                return None
-            oldest_item = min(self._store.values(), key=lambda item: item.created_at)
-            del self._store[oldest_item.id]
-            return oldest_item
+            self._cleanup_locked()
+            return self._pop_oldest_locked()
+
+    def pop_oldest_n(self, n: int) -> List[MemoryItem]:
+        """برداشتن n آیتم قدیمی‌تر (غیرمنقضی)؛ برای انتقال دسته‌ای به long-term."""
+        oldest: List[MemoryItem] = []
+        with self._lock:
+            self._cleanup_locked()
+            while len(oldest) < n:
+                item = self._pop_oldest_locked()
+                if item is None:
+                    break
+                oldest.append(item)
+        return oldest
+
+    def peek_oldest_n(self, n: int) -> List[MemoryItem]:
+        """n آیتم قدیمی‌تر (غیرمنقضی) بدون حذف آن‌ها؛ ورودی‌های مردهٔ heap نادیده گرفته می‌شوند."""
+        with self._lock:
+            self._cleanup_locked()
+            live = (entry for entry in self._created_heap if entry[1] in self._store)
+            return [self._store[item_id] for _, item_id in heapq.nsmallest(n, live)]
+
+    def remove_many(self, item_ids: Iterable[str]) -> int:
+        """حذف آیتم‌ها بر اساس شناسه؛ بازگشت تعداد آیتم‌های حذف‌شده (شناسه‌های ناموجود نادیده گرفته می‌شوند)."""
+        with self._lock:
+            return sum(self._remove_locked(item_id) is not None for item_id in item_ids)
+
+    def _pop_oldest_locked(self) -> Optional[MemoryItem]:
+        """pop از heap تا رسیدن به یک آیتم زنده؛ فرض می‌شود lock از قبل گرفته شده باشد."""
+        while self._created_heap:
+            _, item_id = heapq.heappop(self._created_heap)
+            item = self._remove_locked(item_id)
+            if item is not None:
+                return item
+        return None
+
+    def __len__(self) -> int:
+        """تعداد آیتم‌های غیرمنقضی."""
+        with self._lock:
+            self._cleanup_locked()
+            return len(self._store)
         
 class LongTermMemory:
     """حافظهٔ بلندمدت: ذخیره‌سازی پایدار با SQLite.
@@ -125,106 +308,268 @@ class LongTermMemory:
     """حافظهٔ بلندمدت: ذخیرهٔ پایدار در SQLite.
 
     طراحی مینیمال:
-    - جدول memories(id TEXT PRIMARY KEY, content TEXT, metadata TEXT, created_at REAL)
-    - جستجوی ساده با LIKE برای متن؛ در آینده می‌توان embedding/FAISS افزود.
+    - جدول memories(seq INTEGER PRIMARY KEY, id TEXT UNIQUE, content TEXT, metadata TEXT, created_at REAL)؛
+      seq نام صریح rowid است تا VACUUM شمارهٔ ردیف‌ها و در نتیجه ایندکس FTS را به هم نریزد
+    - جدول مجازی FTS5 به نام memories_fts که با triggerها همگام می‌ماند و جستجو را
+      با رتبه‌بندی BM25 انجام می‌دهد؛ اگر SQLite از FTS5 پشتیبانی نکند، LIKE استفاده می‌شود.
+    - اتصال‌ها در حالت WAL با synchronous=NORMAL و بدون BEGIN ضمنی پایتون (isolation_level=None)؛
+      نوشتن‌های چندتایی در یک تراکنش صریح انجام می‌شوند.
+    - یک pool کوچک از اتصال‌ها (pool_size): خواندن‌ها همزمان و بدون قفل انجام می‌شوند و
+      فقط نوشتن‌ها پشت یک قفل نویسنده سریال می‌شوند. هر thread ترجیحاً همان اتصال قبلی
+      خود را می‌گیرد تا کش صفحات و statementهای آماده‌شدهٔ SQLite حفظ شوند.
     """
 
-    def __init__(self, db_path: Optional[str] = None) -> None:
+    _PRAGMAS = (
+        "PRAGMA journal_mode=WAL",
+        "PRAGMA synchronous=NORMAL",
+        "PRAGMA temp_store=MEMORY",
+        "PRAGMA cache_size=-20000",
+        "PRAGMA mmap_size=268435456",
+    )
+
+    _SQL_CREATE = """
+        CREATE TABLE IF NOT EXISTS memories (
+            seq INTEGER PRIMARY KEY,
+            id TEXT NOT NULL UNIQUE,
+            content TEXT NOT NULL,
+            metadata TEXT,
+            created_at REAL NOT NULL
+        )
+    """
+    _SQL_INSERT = "INSERT INTO memories (id, content, metadata, created_at) VALUES (?, ?, ?, ?)"
+    _SQL_GET = "SELECT id, content, metadata, created_at FROM memories WHERE id = ?"
+    _SQL_DELETE = "DELETE FROM memories WHERE id = ?"
+    _SQL_SEARCH_FTS = """
+        SELECT m.id, m.content, m.metadata, m.created_at
+        FROM memories_fts f JOIN memories m ON m.seq = f.rowid
+        WHERE memories_fts MATCH ?
+        ORDER BY rank
+        LIMIT ?
+    """
+    _SQL_SEARCH_LIKE = """
+        SELECT id, content, metadata, created_at FROM memories
+        WHERE content LIKE ? ESCAPE '\\' OR metadata LIKE ? ESCAPE '\\'
+        LIMIT ?
+    """
+    _SQL_ALL = """
+        SELECT id, content, metadata, created_at FROM memories
+        ORDER BY created_at DESC
+        LIMIT ?
+    """
+
+    def __init__(self, db_path: Optional[str] = None, *, pool_size: int = 4) -> None:
         if db_path is None:
             db_path = str(Path("./data").resolve() / "memories.sqlite3")
         self._db_path = db_path
-        self._conn = sqlite3.connect(self._db_path, check_same_thread=False)
-        self._lock = Lock()
+        # پایگاه دادهٔ ':memory:' برای هر اتصال جداست؛ پس فقط یک اتصال مجاز است
+        self._pool_size = 1 if db_path == ":memory:" else max(1, int(pool_size))
+        self._conns: List[sqlite3.Connection] = []
+        self._idle: List[sqlite3.Connection] = []
+        self._pool_cond = Condition()
+        self._local = local()
+        self._closed = False
+        self._write_lock = Lock()
+        self._fts = False
         self._ensure_tables()
 
+    def _connect(self) -> sqlite3.Connection:
+        """ساخت یک اتصال جدید با pragmaهای مشترک."""
+        conn = sqlite3.connect(self._db_path, check_same_thread=False, isolation_level=None)
+        for pragma in self._PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    @contextmanager
+    def _acquire(self) -> Iterator[sqlite3.Connection]:
+        """گرفتن یک اتصال از pool (ترجیحاً اتصال قبلی همین thread) و برگرداندن آن پس از استفاده."""
+        preferred = getattr(self._local, "conn", None)
+        with self._pool_cond:
+            while True:
+                if self._closed:
+                    raise sqlite3.ProgrammingError("LongTermMemory basteh shode ast")
+                if preferred is not None and preferred in self._idle:
+                    self._idle.remove(preferred)
+                    conn = preferred
+                    break
+                if self._idle:
+                    conn = self._idle.pop()
+                    break
+                if len(self._conns) < self._pool_size:
+                    conn = self._connect()
+                    self._conns.append(conn)
+                    break
+                self._pool_cond.wait()
+        self._local.conn = conn
+        try:
+            yield conn
+        finally:
+            with self._pool_cond:
+                self._idle.append(conn)
+                self._pool_cond.notify_all()
+
     def _ensure_tables(self) -> None:
-        """ایجاد جدول حافظه در صورت عدم وجود."""
-        with self._lock:
-            cursor = self._conn.cursor()
+        """ایجاد جدول حافظه و ایندکس FTS5 آن در صورت عدم وجود."""
+        with self._write_lock, self._acquire() as conn:
+            cursor = conn.cursor()
+            cursor.execute(self._SQL_CREATE)
+            columns = {row[1] for row in cursor.execute("PRAGMA table_info(memories)")}
+            if "seq" not in columns:
+                self._migrate_seq_locked(cursor)
+            self._fts = self._ensure_fts_locked(cursor)
+
+    def _migrate_seq_locked(self, cursor: sqlite3.Cursor) -> None:
+        """مهاجرت جدول قدیمی (id TEXT PRIMARY KEY با rowid ضمنی) به جدول دارای ستون seq.
+
+        rowid ضمنی ممکن است با VACUUM از نو شماره‌گذاری شود و ایندکس FTS که به آن اشاره
+        می‌کند را بی‌صدا ناهمگام کند؛ پس جدول با همان ترتیب ردیف‌ها بازسازی و ایندکس FTS
+        قدیمی حذف می‌شود تا از روی seq دوباره ساخته شود.
+        """
+        with self._transaction_locked(cursor):
+            for trigger in ("memories_ai", "memories_ad", "memories_au"):
+                cursor.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+            cursor.execute("DROP TABLE IF EXISTS memories_fts")
+            cursor.execute("ALTER TABLE memories RENAME TO memories_old")
+            cursor.execute(self._SQL_CREATE)
             cursor.execute("""
-                CREATE TABLE IF NOT EXISTS memories (
-                    id TEXT PRIMARY KEY,
-                    content TEXT NOT NULL,
-                    metadata TEXT,
-                    created_at REAL NOT NULL
-                )
+                INSERT INTO memories (id, content, metadata, created_at)
+                SELECT id, content, metadata, created_at FROM memories_old ORDER BY rowid
+            """)
+            cursor.execute("DROP TABLE memories_old")
+
+    def _ensure_fts_locked(self, cursor: sqlite3.Cursor) -> bool:
+        """ایجاد جدول FTS5 و triggerهای همگام‌سازی؛ بازگشت False اگر FTS5 در دسترس نباشد.
+
+        جدول FTS از نوع external content است و به ستون seq جدول memories اشاره می‌کند.
+        """
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'memories_fts'")
+        existed = cursor.fetchone() is not None
+        try:
+            cursor.executescript("""
+                CREATE VIRTUAL TABLE IF NOT EXISTS memories_fts USING fts5(
+                    content, metadata,
+                    content='memories', content_rowid='seq',
+                    tokenize='unicode61 remove_diacritics 2'
+                );
+                CREATE TRIGGER IF NOT EXISTS memories_ai AFTER INSERT ON memories BEGIN
+                    INSERT INTO memories_fts(rowid, content, metadata)
+                    VALUES (new.seq, new.content, new.metadata);
+                END;
+                CREATE TRIGGER IF NOT EXISTS memories_ad AFTER DELETE ON memories BEGIN
+                    INSERT INTO memories_fts(memories_fts, rowid, content, metadata)
+                    VALUES ('delete', old.seq, old.content, old.metadata);
+                END;
+                CREATE TRIGGER IF NOT EXISTS memories_au AFTER UPDATE ON memories BEGIN
+                    INSERT INTO memories_fts(memories_fts, rowid, content, metadata)
+                    VALUES ('delete', old.seq, old.content, old.metadata);
+                    INSERT INTO memories_fts(rowid, content, metadata)
+                    VALUES (new.seq, new.content, new.metadata);
+                END;
             """)
-            self._conn.commit()
+            if not existed:
+                # مهاجرت: ایندکس کردن ردیف‌هایی که پیش از ساخت FTS وجود داشتند
+                cursor.execute("INSERT INTO memories_fts(memories_fts) VALUES ('rebuild')")
+            return True
+        except sqlite3.OperationalError as exc:
+            logger.warning("FTS5 dar dastras nist, jostojoo ba LIKE anjam mishavad: %s", exc)
+            return False
+
+    @contextmanager
+    def _transaction_locked(self, cursor: sqlite3.Cursor) -> Iterator[None]:
+        """تراکنش صریح BEGIN IMMEDIATE ... COMMIT؛ فرض می‌شود قفل نویسنده از قبل گرفته شده باشد."""
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            cursor.execute("ROLLBACK")
+            raise
+        cursor.execute("COMMIT")
 
     def add(self, content: str, metadata: Optional[Dict[str, Any]] = None) -> MemoryItem:
         """افزودن یک آیتم به حافظهٔ بلندمدت و برگرداندن MemoryItem آن."""
-        if metadata is None:
-            metadata = {}
+        metadata = _intern_keys(metadata) if metadata else {}
         item_id = str(uuid.uuid4())
         now = time.time()
-        meta_json = json.dumps(metadata, ensure_ascii=False)
-        with self._lock:
-            cursor = self._conn.cursor()
-            cursor.execute("""
-                INSERT INTO memories (id, content, metadata, created_at)
-                VALUES (?, ?, ?, ?)
-            """, (item_id, content, meta_json, now))
-            self._conn.commit()
+        meta_json = _dumps(metadata)
+        with self._write_lock, self._acquire() as conn:
+            conn.execute(self._SQL_INSERT, (item_id, content, meta_json, now))
 
         return MemoryItem(id=item_id, content=content, metadata=metadata, created_at=now)
+
+    def add_many(self, items: Iterable[MemoryItem]) -> List[MemoryItem]:
+        """افزودن دسته‌ای آیتم‌ها (با حفظ id و created_at) در یک تراکنش واحد."""
+        stored = [MemoryItem(id=item.id, content=item.content, metadata=item.metadata, created_at=item.created_at)
+                  for item in items]
+        if not stored:
+            return stored
+        rows = [(item.id, item.content, _dumps(item.metadata), item.created_at)
+                for item in stored]
+        with self._write_lock, self._acquire() as conn:
+            cursor = conn.cursor()
+            with self._transaction_locked(cursor):
+                cursor.executemany(self._SQL_INSERT, rows)
+        return stored
+
     def get(self, item_id: str) -> Optional[MemoryItem]:
         """دریافت آیتم بر اساس شناسه از پایگاه داده."""
-        with self._lock:
-            cursor = self._conn.cursor()
-            cursor.execute("SELECT id, content, metadata, created_at FROM memories WHERE id = ?", (item_id,))
-            row = cursor.fetchone()
-            if row is None:
-                return None
-            meta_dict = json.loads(row[2]) if row[2] else {}
-            return MemoryItem(id=row[0], content=row[1], metadata=meta_dict, created_at=row[3])
+        with self._acquire() as conn:
+            cursor = conn.cursor()
+            cursor.execute(self._SQL_GET, (item_id,))
+            return next(_iter_items(cursor), None)
         
     def search(self, query: str, limit: int = 10) -> List[MemoryItem]:
-        """جستجوی ساده بر اساس LIKE روی ستون content و metadata."""
-        like_q = f"%{query}%"
-        with self._lock:
-            cursor = self._conn.cursor()
-            cursor.execute("""
-                SELECT id, content, metadata, created_at FROM memories
-                WHERE content LIKE ? OR metadata LIKE ?
-                LIMIT ?
-            """, (like_q, like_q, limit))
-            rows = cursor.fetchall()
+        """جستجوی متنی روی content و metadata.
+
+        ابتدا از ایندکس FTS5 (مرتب‌شده با BM25) استفاده می‌شود که فقط پیشوند توکن‌ها را تطبیق
+        می‌دهد؛ اگر تعداد نتایج کمتر از limit باشد، باقی ظرفیت با تطبیق زیررشته‌ای LIKE (مثلاً
+        بخشی از وسط یک کلمه) و بدون تکرار پر می‌شود. پس هر نتیجه‌ای که LIKE پیدا می‌کند تا سقف
+        limit همچنان برگردانده می‌شود و فقط ترتیب (اول نتایج رتبه‌بندی‌شدهٔ FTS) تغییر کرده است.
+        """
+        with self._acquire() as conn:
+            cursor = conn.cursor()
+            # ردیف‌ها در دسته‌های arraysize تایی از لایهٔ C خوانده و مستقیم به MemoryItem تبدیل می‌شوند
+            cursor.arraysize = max(limit, 64)
             results: List[MemoryItem] = []
-            for row in rows:
-                meta_dict = json.loads(row[2]) if row[2] else {}
-                results.append(MemoryItem(id=row[0], content=row[1], metadata=meta_dict, created_at=row[3]))
+            match = _fts_query(query) if self._fts else ""
+            if match:
+                try:
+                    cursor.execute(self._SQL_SEARCH_FTS, (match, limit))
+                    results = list(itertools.islice(_iter_items(cursor), limit))
+                except sqlite3.OperationalError as exc:
+                    logger.warning("Khata dar jostojooye FTS, estefade az LIKE: %s", exc)
+            if len(results) < limit:
+                seen = {item.id for item in results}
+                # کاراکترهای % و _ در متن کاربر به صورت تحت‌اللفظی جستجو می‌شوند
+                like_q = f"%{_escape_like(query)}%"
+                cursor.execute(self._SQL_SEARCH_LIKE, (like_q, like_q, limit + len(seen)))
+                extra = (item for item in _iter_items(cursor) if item.id not in seen)
+                results.extend(itertools.islice(extra, limit - len(results)))
             return results
+
     def delete(self, item_id: str) -> bool: 
         """حذف آیتم بر اساس شناسه. بازگشت True اگر آیتم حذف شده باشد."""
-        with self._lock:
-            cursor = self._conn.cursor()
-            cursor.execute("DELETE FROM memories WHERE id = ?", (item_id,))
-            self._conn.commit()
+        with self._write_lock, self._acquire() as conn:
+            cursor = conn.cursor()
+            cursor.execute(self._SQL_DELETE, (item_id,))
             return cursor.rowcount > 0
         
     def all(self, limit: int = 100) -> List[MemoryItem]:
         """دریافت مجموعه‌ای از آیتم‌ها (جدیدترین‌ها ابتدا)."""
-        with self._lock:
-            cursor = self._conn.cursor()
-            cursor.execute("""
-                SELECT id, content, metadata, created_at FROM memories
-                ORDER BY created_at DESC
-                LIMIT ?
-            """, (limit,))
-            rows = cursor.fetchall()
-            results: List[MemoryItem] = []
-            for row in rows:
-                meta_dict = json.loads(row[2]) if row[2] else {}
-                results.append(MemoryItem(id=row[0], content=row[1], metadata=meta_dict, created_at=row[3]))
-            return results
+        with self._acquire() as conn:
+            cursor = conn.cursor()
+            cursor.arraysize = max(limit, 64)
+            cursor.execute(self._SQL_ALL, (limit,))
+            return list(itertools.islice(_iter_items(cursor), limit))
         
     def close(self) -> None:
-        """بستن اتصال پایگاه داده."""
-        with self._lock:
-            try:
-                self._conn.commit()
-            finally: 
-                self._conn.close()
+        """بستن همهٔ اتصال‌های پایگاه داده پس از بازگشت اتصال‌های در حال استفاده."""
+        with self._pool_cond:
+            self._closed = True
+            while len(self._idle) < len(self._conns):
+                self._pool_cond.wait()
+            for conn in self._conns:
+                conn.close()
+            self._conns.clear()
+            self._idle.clear()
 
 
 class MemoryManager:
@@ -237,12 +582,17 @@ class MemoryManager:
     - متدهای کمک برای پاکسازی و شاتر داون
     """
 
-    def __init__(self, *, lt_db_path: Optional[str] = None, consolidation_threshold: int = 50) -> None:
+    def __init__(self, *, lt_db_path: Optional[str] = None, consolidation_threshold: int = 50,
+                 lock: Optional[RLock] = None) -> None:
         # consolidation_threshold: اگر تعداد آیتم‌های short-term بیشتر از این شد، آیتم‌های قدیمی منتقل شوند
-        self.short = ShortTermMemory()
+        # lock: همان RLock حافظهٔ کوتاه‌مدت؛ شمارش و برداشتن آیتم‌ها در همگرایی اتمیک می‌ماند
+        # بدون اینکه قفل جداگانه‌ای همهٔ remember_shortها را پشت همگرایی سریال کند
+        self._lock = lock if lock is not None else RLock()
+        self.short = ShortTermMemory(lock=self._lock)
         self.long = LongTermMemory(db_path=lt_db_path)
         self._consolidation_threshold = max(1, int(consolidation_threshold))
-        self._lock = Lock()
+        # فقط یک thread در هر لحظه آیتم‌ها را منتقل می‌کند تا یک دسته دو بار نوشته نشود
+        self._consolidating = Lock()
 
     def remember_short(self, content: str, ttl: Optional[float] = 60.0, metadata: Optional[Dict[str, Any]] = None) -> MemoryItem:
         """ذخیرهٔ سریع در حافظهٔ کوتاه‌مدت. به‌صورت خودکار ممکن است به حافظهٔ بلندمدت منتقل شود."""
@@ -262,7 +612,9 @@ class MemoryManager:
         if len(results) < limit:
             # کمبود نتایج: جستجو در long-term
             remaining = limit - len(results)
-            results.extend(self.long.search(query, limit=remaining))
+            # آیتمی که در حال انتقال است ممکن است لحظه‌ای در هر دو حافظه باشد
+            seen = {item.id for item in results}
+            results.extend(item for item in self.long.search(query, limit=remaining) if item.id not in seen)
         return results
 
     def forget_long(self, item_id: str) -> bool:
@@ -271,17 +623,22 @@ class MemoryManager:
     
     def _maybe_consolidate(self) -> None:
         """در صورت نیاز، یک یا چند آیتم از short-term را به long-term منتقل می‌کند."""
-        with self._lock: 
-            items = self.short.all_items()
-            if len(items) > self._consolidation_threshold:
-                return
-            # منتقل کردن تا رسیدن به آستانه (حذف قدیمی‌ترین‌ها)
-            to_move_count = len(items) - self._consolidation_threshold
-            for _ in range(to_move_count):
-                old = self.short.pop_oldest()
-                if old is None:
-                    continue
-                self.long.add(content=old.content, metadata=old.metadata)
+        if not self._consolidating.acquire(blocking=False):
+            return  # thread دیگری در حال انتقال است؛ مازاد در فراخوانی بعدی منتقل می‌شود
+        try:
+            with self._lock:
+                # فقط وقتی تعداد از آستانه بیشتر شد، مازاد (قدیمی‌ترین‌ها) منتقل می‌شود
+                excess = len(self.short) - self._consolidation_threshold
+                if excess <= 0:
+                    return
+                batch = self.short.peek_oldest_n(excess)
+            # ابتدا در long-term نوشته و سپس از short-term حذف می‌شوند تا آیتم‌ها هیچ‌گاه از هر دو
+            # حافظه غایب نباشند؛ اگر add_many خطا دهد در short-term باقی می‌مانند.
+            # همهٔ آیتم‌ها در یک تراکنش (یک fsync) نوشته می‌شوند
+            self.long.add_many(batch)
+            self.short.remove_many(item.id for item in batch)
+        finally:
+            self._consolidating.release()
 
     def shutdown(self) -> None:
         """شاتر داون ایمن حافظهٔ بلندمدت."""
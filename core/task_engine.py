@@ -10,23 +10,42 @@ from __future__ import annotations
 
 import asyncio
 import logging
-from typing import Any, List, Optional, Tuple
+import os
+from typing import Any, Callable, List, Optional, Tuple
 
-from .agent_core import create_agent
+from .agent_pool import AgentPool
 
 logger = logging.getLogger(__name__)
 
 
+def uvloop_loop_factory() -> Optional[Callable[[], asyncio.AbstractEventLoop]]:
+    """اگر TASKENGINE_UVLOOP=1 باشد و uvloop نصب باشد، سازندهٔ event loop آن را برمی‌گرداند.
+
+    خروجی برای asyncio.Runner(loop_factory=...) است و policy سراسری را تغییر نمی‌دهد؛
+    در غیر این صورت None (loop پیش‌فرض asyncio).
+    """
+    if os.getenv("TASKENGINE_UVLOOP") != "1":
+        return None
+    try:
+        import uvloop
+    except ImportError:
+        logger.warning("TASKENGINE_UVLOOP=1 ast vali uvloop nasb nashode; az asyncio pishfarz estefade mishavad")
+        return None
+    return uvloop.new_event_loop
+
+
 class TaskEngine:
     """مدیریت صفِ تسک‌ها و اجرای آن‌ها به‌صورت همزمان با محدودیت قابل تنظیم.
 
     پارامترها:
     - concurrency: تعداد همزمانی (کوانتوم اجرا)؛ پیش‌فرض 3
+    - pool: pool مشترک Agentها؛ اگر داده نشود یک AgentPool جدید ساخته می‌شود
     """
 
-    def __init__(self, *, concurrency: int = 3) -> None:
+    def __init__(self, *, concurrency: int = 3, pool: Optional[AgentPool] = None) -> None:
         self.queue: List[Tuple[str, str]] = []
         self._concurrency = max(1, int(concurrency))
+        self._pool = pool if pool is not None else AgentPool()
 
     def add_task(self, task: str, mode: str = "browser") -> None:
         """یک تسک جدید به صف اضافه می‌کند.
@@ -37,18 +56,30 @@ class TaskEngine:
         self.queue.append((task, mode))
 
     async def run_all(self) -> List[Optional[str]]:
-        """تمام تسک‌ها را اجرا می‌کند و لیستی از نتایج (یا None در صورت خطا) بازمی‌گرداند."""
+        """تمام تسک‌ها را اجرا می‌کند و لیستی از نتایج (یا None در صورت خطا) بازمی‌گرداند.
 
-        # Semaphore برای محدود کردن تعداد همزمان اجراها
-        sem = asyncio.Semaphore(self._concurrency)
+        به اندازهٔ concurrency کارگر (worker) ساخته می‌شود که تسک‌ها را از یک صف برمی‌دارند؛
+        همزمانی ساختاری است و برای هر تسک از پیش coroutine ساخته نمی‌شود.
+        """
+
+        self._pool.start_cleaner()
 
-        async def _wrapped_run(task: str, mode: str) -> Optional[str]:
-            async with sem:
-                return await self.run_task(task, mode)
+        results: List[Optional[str]] = [None] * len(self.queue)
+        work: asyncio.Queue[Tuple[int, str, str]] = asyncio.Queue()
+        for idx, (task, mode) in enumerate(self.queue):
+            work.put_nowait((idx, task, mode))
 
-        coros = [_wrapped_run(t, m) for t, m in self.queue]
-        # return_exceptions=False -> در صورت استثنا آن را دریافت و هندل می‌کنیم
-        results = await asyncio.gather(*coros)
+        async def _worker() -> None:
+            while True:
+                try:
+                    idx, task, mode = work.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                # run_task استثناها را خودش هندل می‌کند و در صورت خطا None برمی‌گرداند
+                results[idx] = await self.run_task(task, mode)
+
+        workers = min(self._concurrency, len(results))
+        await asyncio.gather(*(_worker() for _ in range(workers)))
         return results
 
     async def run_task(self, task: str, mode: str) -> Optional[str]:
@@ -57,9 +88,10 @@ class TaskEngine:
         این تابع استثناها را هندل می‌کند و لاگ‌ می‌زند.
         """
         logger.info("🚀 Running: %s", task)
-        agent = create_agent(task, mode)
         try:
-            history: Any = await agent.run()
+            # Agent از pool قرض گرفته می‌شود تا Agentهای هم‌حالت دوباره ساخته نشوند
+            async with self._pool.lease(task, mode) as agent:
+                history: Any = await agent.run()
             # بعضی Agentها ممکن است نوعی تاریخچه متفاوت بازگردانند؛ تلاش می‌کنیم
             # ابتدا به متد final_result دسترسی پیدا کنیم و در صورت نبود آن، نمایشی از history را بازگردانیم.
             try:
@@ -71,4 +103,8 @@ class TaskEngine:
             return result
         except Exception as exc:
             logger.exception("❌ Shekast-Khord: %s", task)
-            return None
\ No newline at end of file
+            return None
+
+    async def close(self) -> None:
+        """بستن Agentهای نگهداری‌شده در pool."""
+        await self._pool.close()
\ No newline at end of file
@@ -6,16 +6,20 @@
 این ماژول مسئول تبدیل گفتار به متن و متن به گفتار است.
 """
 
+import asyncio
+import hashlib
+import html
 import os
 import queue
+import shutil
 import threading
 import logging
-import tempfile
-import subprocess
-from typing import Optional, Callable, Any, cast, Literal
+import time
+from concurrent.futures import Future
+from pathlib import Path
+from typing import Optional, Callable, Any, Dict, List, Sequence, Tuple, cast, Literal
 import speech_recognition as sr
-from google.cloud import texttospeech
-from gtts import gTTS
+import numpy as np
 import sounddevice as sd
 import soundfile as sf
 from pydub import AudioSegment
@@ -23,25 +27,193 @@ import io
 
 logger = logging.getLogger(__name__)
 
+# سیگنال توقف خط لولهٔ گفتار
+_STOP = object()
+
+# VAD ساده پیش از ارسال صدا به سرویس تشخیص گفتار: طول فریم برای RMS (ثانیه) و حداقل
+# تعداد عبور از صفر در ثانیه (کمتر از آن، مانند hum برق شهر، گفتار در نظر گرفته نمی‌شود)
+_VAD_FRAME_SECONDS = 0.02
+_VAD_MIN_CROSSINGS_PER_SEC = 150.0
+
+
+def _build_ssml(texts: List[str]) -> str:
+    """ساخت SSML برای چند متن با مکث کوتاه بین آن‌ها"""
+    return "<speak>" + '<break time="250ms"/>'.join(html.escape(t) for t in texts) + "</speak>"
+
+
+def _is_silent(raw: bytes, sample_rate: int, energy_threshold: float) -> bool:
+    """بررسی سکوت/نویز در صدای PCM شانزده‌بیتی (برداری با numpy)
+
+    انرژی بر اساس بیشترین RMS فریم‌های کوتاه سنجیده می‌شود (نه میانگین کل ضبط) تا یک
+    پاسخ کوتاه مانند "yes" در کنار سکوت انتهای ضبط حذف نشود؛ آستانه همان energy_threshold
+    تشخیص‌دهنده است. صدایی با نرخ عبور از صفر بسیار کم (hum) هم گفتار در نظر گرفته نمی‌شود.
+    """
+    samples = np.frombuffer(raw, dtype=np.int16)
+    frame = max(1, int(sample_rate * _VAD_FRAME_SECONDS))
+    n_frames = samples.size // frame
+    if n_frames == 0:
+        return True
+    frames = samples[:n_frames * frame].astype(np.float32).reshape(n_frames, frame)
+    peak_rms = float(np.sqrt(np.einsum("ij,ij->i", frames, frames) / frame).max())
+    if peak_rms < energy_threshold:
+        return True
+    x = samples.astype(np.float32)
+    x -= x.mean()  # حذف DC
+    crossings = np.count_nonzero(np.signbit(x[1:]) != np.signbit(x[:-1]))
+    return crossings * sample_rate / x.size < _VAD_MIN_CROSSINGS_PER_SEC
+
 class VoiceInput: 
-    """کلاس مدیریت ورودی صوتی (تبدیل گفتار به متن)"""
-    def __init__(self) -> None:
-        """مقداردهی اولیه تشخیص گفتار"""
+    """کلاس مدیریت ورودی صوتی (تبدیل گفتار به متن)
+
+    این کلاس از دو سرویس STT پشتیبانی می‌کند:
+    - Google Web Speech (google): رایگان، پس از پایان جمله کل صدا ارسال می‌شود
+    - Google Cloud Speech-to-Text (google-cloud): استریم صدا هم‌زمان با صحبت کاربر،
+      بنابراین زمان ارسال و پاسخ شبکه پشت زمان صحبت پنهان می‌شود
+    """
+
+    # تنظیمات استریم صوتی برای Google Cloud Speech (16kHz، تک‌کاناله، بلوک‌های 100ms)
+    STREAM_SAMPLE_RATE = 16000
+    STREAM_BLOCK_SIZE = 1600
+
+    def __init__(self, stt_provider: Literal["google", "google-cloud"] = "google") -> None:
+        """مقداردهی اولیه تشخیص گفتار
+
+        Args:
+            stt_provider: انتخاب سرویس STT
+                - "google": Google Web Speech از طریق speech_recognition
+                - "google-cloud": Google Cloud Speech-to-Text (استریم، niaz be etebarname)
+        """
+        self.stt_provider = stt_provider
         self.recognizer = sr.Recognizer()
+        # متد تشخیص یک بار bind می‌شود تا در هر بار تشخیص دوباره جستجو نشود
+        self._recognize: Callable[[sr.AudioData], str] = cast(Any, self.recognizer).recognize_google
         self.microphone = sr.Microphone()
-        self.stop_listening: Optional[Callable[[], None]] = None
+        self.stop_listening: Optional[Callable[..., None]] = None
         self.audio_queue = queue.Queue()
         self.listening_thread: Optional[threading.Thread] = None
         self.is_listening = False
+
+        # کلاینت Google Cloud یک بار ساخته می‌شود تا کانال gRPC (و TLS) بین تشخیص‌ها حفظ شود
+        self.stt_client: Any = None
+        self._streaming_config: Any = None
+        if self.stt_provider == "google-cloud":
+            from google.cloud import speech
+
+            self.stt_client = speech.SpeechClient()
+            self._streaming_config = speech.StreamingRecognitionConfig(
+                config=speech.RecognitionConfig(
+                    encoding=speech.RecognitionConfig.AudioEncoding.LINEAR16,
+                    sample_rate_hertz=self.STREAM_SAMPLE_RATE,
+                    language_code="fa-IR",
+                ),
+                interim_results=True,
+                single_utterance=True,
+            )
+            logger.info("STT Provider: Google Cloud Speech-to-Text (stream)")
+
         self._setup_recognition()
 
     def _setup_recognition(self) -> None:
-        """تنظیم پارامترهای تشخیص صدا و حذف نویز محیط"""
-        with self.microphone as source:
-            self.recognizer.adjust_for_ambient_noise(source, duration=1)
-            # تنظیم حساسیت تشخیص صدا
-            self.recognizer.energy_threshold = 4000
-            self.recognizer.dynamic_energy_threshold = True
+        """تنظیم پارامترهای تشخیص صدا
+
+        کالیبراسیون نویز محیط به اولین باز شدن میکروفون موکول می‌شود (_calibrate) تا
+        ساخت VoiceInput منتظر ضبط نویز نماند.
+        """
+        # تنظیم حساسیت تشخیص صدا
+        self.recognizer.energy_threshold = 4000
+        self.recognizer.dynamic_energy_threshold = True
+        self._calibrated = False
+
+        # میکروفون (sr) و استریم sounddevice یک بار باز می‌شوند و تا shutdown باز می‌مانند؛
+        # باز و بسته کردن PortAudio در هر بار گوش دادن کند است و روی برخی دستگاه‌ها صدای کلیک ایجاد می‌کند
+        self._mic_lock = threading.RLock()
+        self._source: Any = None
+        self._stream: Any = None
+        self._stream_chunks: "queue.Queue[bytes]" = queue.Queue()
+        self._capturing = threading.Event()
+        self._stream_done: Optional[threading.Event] = None
+        self._stream_call: Any = None
+
+    def _calibrate(self, source: Any) -> None:
+        """حذف نویز محیط فقط در اولین استفاده از میکروفون باز (با dynamic_energy_threshold کافی است)"""
+        if self._calibrated:
+            return
+        self.recognizer.adjust_for_ambient_noise(source, duration=0.3)
+        self._calibrated = True
+
+    def _open_source(self) -> Any:
+        """باز کردن میکروفون sr در اولین استفاده و برگرداندن همان source در دفعات بعد (با _mic_lock)"""
+        if self._source is None:
+            self._source = self.microphone.__enter__()
+            self._calibrate(self._source)
+        return self._source
+
+    def _on_stream_audio(self, indata, frames, time_info, status) -> None:
+        """callback استریم sounddevice؛ قطعه‌ها فقط هنگام گوش دادن نگه داشته می‌شوند"""
+        if self._capturing.is_set():
+            self._stream_chunks.put(bytes(indata))
+
+    def _open_stream(self) -> None:
+        """باز کردن استریم ورودی sounddevice در اولین استفاده (با _mic_lock)"""
+        if self._stream is None:
+            self._stream = sd.InputStream(samplerate=self.STREAM_SAMPLE_RATE, blocksize=self.STREAM_BLOCK_SIZE,
+                                          channels=1, dtype="int16", callback=self._on_stream_audio)
+            self._stream.start()
+
+    def _listen_streaming(self, timeout: Optional[int] = None) -> str:
+        """ضبط و تشخیص هم‌زمان با Google Cloud Speech (streaming_recognize)
+
+        قطعه‌های صوتی میکروفون همان لحظه ارسال می‌شوند و با اولین نتیجهٔ نهایی بازگشت انجام می‌شود.
+        خطاها به استثناهای speech_recognition تبدیل می‌شوند تا listen_once یکسان آن‌ها را مدیریت کند.
+        """
+        from google.cloud import speech
+
+        chunks = self._stream_chunks
+        heard = threading.Event()
+        done = threading.Event()
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        def requests():
+            while not done.is_set():
+                # اگر تا پایان timeout گفتاری شنیده نشد، ارسال متوقف می‌شود
+                if deadline is not None and not heard.is_set() and time.monotonic() > deadline:
+                    return
+                try:
+                    chunk = chunks.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+                yield speech.StreamingRecognizeRequest(audio_content=chunk)
+
+        with self._mic_lock:
+            self._open_stream()
+            # قطعه‌های باقی‌مانده از دفعهٔ قبل دور ریخته می‌شوند
+            while not chunks.empty():
+                chunks.get_nowait()
+            logger.info("Dar hale Goosh dadan (stream)...")
+            # shutdown از طریق این دو مقدار، بدون نیاز به _mic_lock، استریم را متوقف می‌کند
+            self._stream_done = done
+            self._capturing.set()
+            try:
+                responses = self.stt_client.streaming_recognize(config=self._streaming_config, requests=requests())
+                self._stream_call = responses
+                for response in responses:
+                    for result in response.results:
+                        heard.set()
+                        if result.is_final and result.alternatives:
+                            return result.alternatives[0].transcript
+            except Exception as e:
+                # خطای لغو درخواست هنگام shutdown گزارش نمی‌شود
+                if not done.is_set():
+                    raise sr.RequestError(str(e)) from e
+            finally:
+                self._capturing.clear()
+                done.set()
+                self._stream_done = None
+                self._stream_call = None
+
+        if not heard.is_set():
+            raise sr.WaitTimeoutError("listening timed out while waiting for phrase to start")
+        raise sr.UnknownValueError()
 
     def listen_once(self, timeout: Optional[int] = None) -> str:
         """یک‌بار گوش دادن و تبدیل گفتار به متن
@@ -53,11 +225,19 @@ class VoiceInput:
             متن تشخیص داده شده یا رشته خالی در صورت خطا
         """
         try:
-            with self.microphone as source:
-                logger.info("Dar hale Goosh dadan...")
-                audio = self.recognizer.listen(source, timeout=timeout)
+            if self.stt_provider == "google-cloud":
+                text = self._listen_streaming(timeout)
+            else:
+                with self._mic_lock:
+                    source = self._open_source()
+                    logger.info("Dar hale Goosh dadan...")
+                    audio = self.recognizer.listen(source, timeout=timeout)
 
-            text = cast(Any, self.recognizer).recognize_google(audio)
+                if _is_silent(audio.get_raw_data(convert_width=2), audio.sample_rate,
+                              self.recognizer.energy_threshold):
+                    logger.debug("Seda-ye zabt shode goftar nist; ersal nashod.")
+                    return ""
+                text = self._recognize(audio)
             logger.info(f"Tashkhis Dade Shod: {text}")
             return text
         except sr.WaitTimeoutError:
@@ -76,22 +256,106 @@ class VoiceInput:
         
     def start_continuous(self, callback: Callable[[str], Any]) -> None:
         """شروع گوش دادن مداوم در یک thread جداگانه
+
+        در حالت google، یک thread جمله‌ها را از میکروفون باز ضبط می‌کند و تشخیص هر جمله در thread
+        جداگانه انجام می‌شود؛ پس ضبط جملهٔ بعدی منتظر پاسخ شبکه برای جملهٔ قبلی نمی‌ماند.
         
         Args:
             callback: تابعی که با متن تشخیص داده شده فراخوانی می‌شود
         """
-        def listener_thread():
-            while self.is_listening:
-                text = self.listen_once()
-                if text:
-                    callback(text)
-
         self.is_listening = True
-        threading.Thread(target=listener_thread, daemon=True).start()
+
+        if self.stt_provider == "google-cloud":
+            # استریم خودش ضبط و تشخیص را هم‌زمان انجام می‌دهد
+            def listener_thread():
+                while self.is_listening:
+                    text = self.listen_once()
+                    if text:
+                        callback(text)
+
+            self.listening_thread = threading.Thread(target=listener_thread, daemon=True)
+            self.listening_thread.start()
+            return
+
+        def recognizer_thread():
+            while True:
+                audio = self.audio_queue.get()
+                if audio is None:  # سیگنال توقف
+                    break
+                if _is_silent(audio.get_raw_data(convert_width=2), audio.sample_rate,
+                              self.recognizer.energy_threshold):
+                    continue
+                try:
+                    text = self._recognize(audio)
+                except sr.UnknownValueError:
+                    continue
+                except Exception as e:
+                    logger.error(f"Khataye khadamat-e tashkhis: {str(e)}")
+                    continue
+                logger.info(f"Tashkhis Dade Shod: {text}")
+                callback(text)
+
+        stopped = threading.Event()
+
+        def capture_thread():
+            # معادل listen_in_background، اما روی میکروفونی که از قبل باز است
+            while not stopped.is_set():
+                with self._mic_lock:
+                    try:
+                        audio = self.recognizer.listen(self._open_source(), timeout=1)
+                    except sr.WaitTimeoutError:
+                        continue
+                    except Exception as e:
+                        logger.error(f"Khataye gheire montazere: {str(e)}")
+                        stopped.wait(1)
+                        continue
+                if not stopped.is_set():
+                    self.audio_queue.put(audio)
+
+        capture = threading.Thread(target=capture_thread, daemon=True)
+
+        def stopper(wait_for_stop: bool = True) -> None:
+            stopped.set()
+            if wait_for_stop:
+                capture.join()
+
+        self.listening_thread = threading.Thread(target=recognizer_thread, daemon=True)
+        self.listening_thread.start()
+        capture.start()
+        self.stop_listening = stopper
 
     def stop_continuous(self) -> None:
         """توقف گوش دادن مداوم"""
         self.is_listening = False
+        if self.stop_listening is not None:
+            self.stop_listening(wait_for_stop=False)
+            self.stop_listening = None
+            self.audio_queue.put(None)
+
+    def shutdown(self) -> None:
+        """توقف گوش دادن و بستن میکروفون و استریم ورودی"""
+        self.stop_continuous()
+        # درخواست استریم در حال اجرا (که _mic_lock را نگه داشته) پیش از گرفتن قفل متوقف می‌شود
+        done, call = self._stream_done, self._stream_call
+        if done is not None:
+            done.set()
+        cancel = getattr(call, "cancel", None)
+        if callable(cancel):
+            try:
+                cancel()
+            except Exception:
+                pass
+        try:
+            with self._mic_lock:
+                if self._source is not None:
+                    self._source = None
+                    self.microphone.__exit__(None, None, None)
+                if self._stream is not None:
+                    stream, self._stream = self._stream, None
+                    stream.stop()
+                    stream.close()
+        except Exception as e:
+            logger.error(f"khata dar bastan microphone: {str(e)}")
 
 class VoiceOutput:
     """کلاس مدیریت خروجی صوتی (تبدیل متن به گفتار)
@@ -99,23 +363,50 @@ class VoiceOutput:
     این کلاس از دو سرویس TTS پشتیبانی می‌کند:
     - Google Cloud TTS (google-cloud): کیفیت بالاتر، پرداختی
     - gTTS (gtts): رایگان، کیفیت معقول
+
+    خروجی هر سرویس روی دیسک کش می‌شود تا عبارت‌های تکراری (مانند پیام‌های ثابت main.py)
+    بدون درخواست شبکه پخش شوند.
     """
-    
-    def __init__(self, tts_provider: Literal["google-cloud", "gtts"] = "google-cloud") -> None:
+
+    # مسیر کش صوتی (همان پوشه‌ای که setup_environment در main.py می‌سازد) و سقف حجم آن
+    CACHE_DIR = Path("data/logs/cache/tts")
+    CACHE_MAX_BYTES = 100 * 1024 * 1024
+
+    # ادغام متن‌های پشت سر هم در یک درخواست Google Cloud (SSML): زمان انتظار و سقف حجم ورودی API
+    BATCH_WAIT_SECONDS = 0.05
+    BATCH_MAX_BYTES = 5000
+
+    def __init__(self, tts_provider: Literal["google-cloud", "gtts"] = "google-cloud",
+                 preload_phrases: Sequence[str] = ()) -> None:
         """مقداردهی اولیه موتور تبدیل متن به گفتار
         
         Args:
             tts_provider: انتخاب سرویس TTS
                 - "google-cloud": Google Cloud Text-to-Speech (niaz be etebarname)
                 - "gtts": gTTS سرویس رایگان
+            preload_phrases: عبارت‌های ثابتی که فراخواننده بارها پخش می‌کند؛ هنگام راه‌اندازی
+                در پس‌زمینه سنتز و decode می‌شوند
         """
         self.tts_provider = tts_provider
-        self.speaking_queue = queue.Queue()
+        self.speaking_queue: "asyncio.Queue[Any]"
+        self._audio_queue: "asyncio.Queue[Any]"
         self.is_speaking = False
-        self.temp_dir = tempfile.mkdtemp()
+        # آخرین متن ارسال‌شده به صف و تعداد متن‌های در انتظار پخش (برای حذف تکرار پشت سر هم)
+        self._enqueue_lock = threading.Lock()
+        self._last_enqueued: Optional[str] = None
+        self._pending = 0
+        self.cache_dir = self.CACHE_DIR
+        self._cache_lock = threading.Lock()
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+        except OSError as e:
+            logger.warning(f"Sakhtan-e poosheh cache TTS momken nist: {str(e)}")
         
         # مقداردهی سرویس Google Cloud (اگر استفاده شود)
         if self.tts_provider == "google-cloud":
+            # کتابخانه‌های TTS فقط برای سرویس انتخاب‌شده بارگذاری می‌شوند
+            from google.cloud import texttospeech
+
             self.client = texttospeech.TextToSpeechClient()
             self.voice = texttospeech.VoiceSelectionParams(
                 language_code="fa-IR",
@@ -127,11 +418,35 @@ class VoiceOutput:
                 pitch=0.0,
                 volume_gain_db=0.0
             )
+            # کلید کش به صدا و تنظیمات خروجی وابسته است تا تغییر آن‌ها صدای قدیمی را پخش نکند
+            self._cache_variant = "|".join(str(v) for v in (
+                self.voice.language_code,
+                self.voice.name,
+                int(self.audio_config.audio_encoding),
+                self.audio_config.speaking_rate,
+                self.audio_config.pitch,
+                self.audio_config.volume_gain_db,
+                self.audio_config.sample_rate_hertz,
+            ))
             logger.info("TTS Provider: Google Cloud Text-to-Speech")
         else:
+            # gTTS پشتیبانی فارسی قابل اعتمادی ندارد، بنابراین خروجی به انگلیسی تولید می‌شود
+            self._gtts_lang = "en"
+            self._gtts_slow = False
+            self._cache_variant = f"{self._gtts_lang}|{self._gtts_slow}"
             logger.info("TTS Provider: gTTS (rayegan)")
         
-        self._start_speaker_thread()
+        # عبارت -> Future با (آرایهٔ صوتی، نرخ نمونه‌برداری) یا None؛ speak برای عبارتی که هنوز در حال
+        # آماده‌سازی است منتظر همین Future می‌ماند و آن را دوباره سنتز نمی‌کند
+        self._preloaded: Dict[str, "Future[Optional[Tuple[np.ndarray, int]]]"] = {
+            phrase: Future() for phrase in dict.fromkeys(preload_phrases)
+        }
+        if self.tts_provider == "gtts":
+            self._decode_mp3 = self._select_mp3_decoder()
+        if self._preloaded:
+            threading.Thread(target=self._preload_phrases, daemon=True).start()
+        
+        self._start_speaker_loop()
 
     def _synthesize_speech_google_cloud(self, text: str) -> bytes:
         """تبدیل متن به صدا با استفاده از Google Cloud TTS
@@ -142,6 +457,8 @@ class VoiceOutput:
         Returns:
             داده‌های صوتی به صورت bytes
         """
+        from google.cloud import texttospeech
+
         synthesis_input = texttospeech.SynthesisInput(text=text)
         response = self.client.synthesize_speech(
             input=synthesis_input,
@@ -159,25 +476,101 @@ class VoiceOutput:
         Returns:
             داده‌های صوتی به صورت bytes
         """
-        temp_mp3 = os.path.join(self.temp_dir, "temp_gtts.mp3")
+        from gtts import gTTS
+
+        # خروجی MP3 مستقیماً در حافظه نوشته می‌شود (بدون فایل موقت)
+        buf = io.BytesIO()
+        gTTS(text=text, lang=self._gtts_lang, slow=self._gtts_slow).write_to_fp(buf)
+        return buf.getvalue()
+
+    def _cache_path(self, text: str) -> Path:
+        """مسیر فایل کش برای (سرویس، صدا، متن)"""
+        key = hashlib.sha256(f"{self.tts_provider}|{self._cache_variant}|{text}".encode("utf-8")).hexdigest()
+        ext = "mp3" if self.tts_provider == "gtts" else "wav"
+        return self.cache_dir / f"{key}.{ext}"
+
+    def _cache_get(self, path: Path) -> Optional[bytes]:
+        """خواندن صدای کش‌شده؛ None در صورت نبود فایل"""
         try:
-            # ایجاد و ذخیره فایل صوتی gTTS
-            # gTTS پشتیبانی فارسی قابل اعتمادی ندارد، بنابراین خروجی به انگلیسی تولید می‌شود
-            tts = gTTS(text=text, lang='en', slow=False)
-            tts.save(temp_mp3)
+            data = path.read_bytes()
+        except OSError:
+            return None
+        try:
+            # به‌روزرسانی زمان فایل برای حذف LRU (atime روی بسیاری از سیستم‌ها غیرفعال است)
+            os.utime(path)
+        except OSError:
+            pass
+        return data
 
-            # خواندن فایل MP3 و تبدیل به bytes
-            with open(temp_mp3, 'rb') as f:
-                audio_bytes = f.read()
+    def _cache_put(self, path: Path, data: bytes) -> None:
+        """ذخیرهٔ اتمیک صدا در کش و حذف قدیمی‌ترین فایل‌ها در صورت عبور از سقف حجم"""
+        tmp = path.with_suffix(".part")
+        with self._cache_lock:
+            try:
+                tmp.write_bytes(data)
+                tmp.replace(path)
+                self._evict_cache_locked()
+            except OSError as e:
+                logger.warning(f"Khata dar zakhire cache TTS: {str(e)}")
+                # فایل نیمه‌کاره (در صورت وجود) با یک فراخوانی حذف می‌شود
+                try:
+                    os.unlink(tmp)
+                except OSError:
+                    pass
 
-            return audio_bytes
-        finally:
-            # پاک‌سازی فایل موقت
-            if os.path.exists(temp_mp3):
-                os.remove(temp_mp3)
+    def _evict_cache_locked(self) -> None:
+        """حذف فایل‌های کمتر استفاده‌شده تا زمانی که حجم کش زیر CACHE_MAX_BYTES برسد"""
+        entries = []
+        total = 0
+        for entry in os.scandir(self.cache_dir):
+            if not entry.is_file() or entry.name.endswith(".part"):
+                continue
+            st = entry.stat()
+            entries.append((st.st_mtime, st.st_size, entry.path))
+            total += st.st_size
+        if total <= self.CACHE_MAX_BYTES:
+            return
+        entries.sort()
+        for _, size, file_path in entries:
+            if total <= self.CACHE_MAX_BYTES:
+                break
+            try:
+                os.remove(file_path)
+                total -= size
+            except OSError:
+                pass
+
+    def _synthesize_batch(self, texts: List[str]) -> bytes:
+        """سنتز یک یا چند متن؛ چند متن با یک درخواست SSML به Google Cloud ارسال می‌شوند
+        
+        Args:
+            texts: متن‌ها به ترتیب پخش
+            
+        Returns:
+            داده‌های صوتی به صورت bytes
+        """
+        if len(texts) == 1:
+            return self._synthesize_speech(texts[0])
+
+        ssml = _build_ssml(texts)
+        path = self._cache_path(ssml)
+        cached = self._cache_get(path)
+        if cached is not None:
+            return cached
+
+        from google.cloud import texttospeech
+
+        response = self.client.synthesize_speech(
+            input=texttospeech.SynthesisInput(ssml=ssml),
+            voice=self.voice,
+            audio_config=self.audio_config
+        )
+        data = response.audio_content
+        self._cache_put(path, data)
+        return data
 
     def _synthesize_speech(self, text: str) -> bytes:
-        """تبدیل متن به صدا با استفاده از سرویس انتخاب‌شده
+        """تبدیل متن به صدا با استفاده از سرویس انتخاب‌شده (با کش دیسکی)
         
         Args:
             text: متن برای تبدیل به گفتار
@@ -185,77 +578,194 @@ class VoiceOutput:
         Returns:
             داده‌های صوتی به صورت bytes
         """
+        path = self._cache_path(text)
+        cached = self._cache_get(path)
+        if cached is not None:
+            return cached
+
         if self.tts_provider == "google-cloud":
-            return self._synthesize_speech_google_cloud(text)
+            data = self._synthesize_speech_google_cloud(text)
         else:
-            return self._synthesize_speech_gtts(text)
+            data = self._synthesize_speech_gtts(text)
+        self._cache_put(path, data)
+        return data
 
-    def _play_audio(self, audio_content: bytes, is_mp3: bool = False) -> None:
-        """پخش صدا با استفاده از sounddevice و ffplay
-        
-        Args:
-            audio_content: داده‌های صوتی به صورت bytes
-            is_mp3: آیا فرمت صوتی MP3 است (برای gTTS)
+    def _decode_audio(self, audio_content: bytes) -> Optional[Tuple[np.ndarray, int]]:
+        """decode صدای خروجی سرویس به آرایهٔ int16 و نرخ نمونه‌برداری
+
+        خروجی هر دو سرویس (MP3 برای gTTS و WAV برای Google Cloud) از حافظه decode می‌شود؛
+        در صورت خطا None برگردانده می‌شود.
         """
-        if is_mp3:
-            # برای gTTS که MP3 است
-            temp_mp3 = os.path.join(self.temp_dir, "temp_audio.mp3")
+        if self.tts_provider == "gtts":
+            return self._decode_mp3(audio_content)
+        return self._decode_wav(audio_content)
+
+    def _decode_wav(self, audio_content: bytes) -> Optional[Tuple[np.ndarray, int]]:
+        """WAV خطی (LINEAR16) مستقیماً به int16 خوانده می‌شود؛ بدون تبدیل به float64 و بدون pydub"""
+        try:
+            samples, samplerate = sf.read(io.BytesIO(audio_content), dtype="int16", always_2d=False)
+            return samples, samplerate
+        except Exception as decode_error:
+            logger.warning(f"decode seda anjam nashod:\n{str(decode_error)}")
+            return None
+
+    def _select_mp3_decoder(self) -> Callable[[bytes], Optional[Tuple[np.ndarray, int]]]:
+        """انتخاب یک‌بارهٔ روش decode برای MP3 بر اساس ابزارهای موجود روی سیستم"""
+        # pydub برای decode کردن MP3 به ffmpeg (یا avconv) نیاز دارد
+        if shutil.which(getattr(AudioSegment, "converter", None) or "ffmpeg"):
+            return self._decode_mp3_pydub
+        logger.warning("ffmpeg peyda nashod; seda-ye gTTS pakhsh nemishavad.")
+        logger.info("baraye pakhsh sahih ffmpeg ra nasb konid: choco install ffmpeg")
+        return self._decode_mp3_unavailable
+
+    def _decode_mp3_pydub(self, audio_content: bytes) -> Optional[Tuple[np.ndarray, int]]:
+        """decode MP3 درون همین پردازه با pydub"""
+        try:
+            seg = AudioSegment.from_file(io.BytesIO(audio_content), format="mp3")
+        except Exception as decode_error:
+            logger.warning(f"decode seda anjam nashod:\n{str(decode_error)}")
+            return None
+
+        if seg.sample_width != 2:
+            seg = seg.set_sample_width(2)
+        samples = np.frombuffer(seg.raw_data, dtype=np.int16)
+        if seg.channels > 1:
+            samples = samples.reshape(-1, seg.channels)
+        return samples, seg.frame_rate
+
+    def _decode_mp3_unavailable(self, audio_content: bytes) -> Optional[Tuple[np.ndarray, int]]:
+        """بدون ffmpeg امکان decode وجود ندارد (هشدار یک بار هنگام راه‌اندازی داده شده است)"""
+        return None
+
+    def _play_samples(self, samples: np.ndarray, samplerate: int) -> None:
+        """پخش آرایهٔ صوتی decode‌شده و انتظار تا پایان آن"""
+        sd.play(samples, samplerate)
+        sd.wait()
+
+    def _preload_phrases(self) -> None:
+        """سنتز و decode عبارت‌های preload_phrases به ترتیب (در thread پس‌زمینه)"""
+        for phrase, future in self._preloaded.items():
             try:
-                # ذخیره MP3
-                with open(temp_mp3, 'wb') as f:
-                    f.write(audio_content)
-                
-                # تلاش برای پخش MP3 با ffplay
+                decoded = self._decode_audio(self._synthesize_speech(phrase))
+            except Exception as e:
+                logger.warning(f"Khata dar pish-bargozari ebarat: {str(e)}")
+                decoded = None
+            future.set_result(decoded)
+
+    def _start_speaker_loop(self) -> None:
+        """راه‌اندازی حلقهٔ asyncio اختصاصی گفتار در یک thread پس‌زمینه
+
+        main.py از speak به صورت هم‌زمان (sync) استفاده می‌کند، پس حلقهٔ گفتار جدا از حلقهٔ
+        اصلی برنامه اجرا می‌شود و متن‌ها با call_soon_threadsafe به آن سپرده می‌شوند.
+        """
+        self._loop = asyncio.new_event_loop()
+        ready = threading.Event()
+
+        def run_loop() -> None:
+            asyncio.set_event_loop(self._loop)
+            self.speaking_queue = asyncio.Queue()
+            # صف بین مرحلهٔ سنتز و مرحلهٔ پخش؛ حداکثر دو جملهٔ آماده جلوتر از پخش
+            self._audio_queue = asyncio.Queue(maxsize=2)
+            ready.set()
+            self._loop.run_forever()
+
+        self.speaker_thread = threading.Thread(target=run_loop, daemon=True)
+        self.speaker_thread.start()
+        ready.wait()
+        self._speaker_future = asyncio.run_coroutine_threadsafe(self._speaker(), self._loop)
+
+    async def _speaker(self) -> None:
+        """خط لولهٔ گفتار: سنتز جملهٔ بعدی هم‌زمان با پخش جملهٔ فعلی انجام می‌شود
+
+        هر مورد صف صوتی به شکل ((آرایه، نرخ) یا None، تعداد متن) است تا پس از پخش، به همان
+        تعداد task_done فراخوانی شود.
+        """
+        loop = asyncio.get_running_loop()
+
+        async def collect_batch(first: str) -> Tuple[List[str], Any]:
+            """جمع‌آوری متن‌هایی که بلافاصله پس از first در صف قرار گرفته‌اند (فقط Google Cloud)
+
+            متن بعدی که قابل ادغام نیست (سیگنال توقف یا عبارت از پیش آماده) به عنوان carry برمی‌گردد.
+            """
+            texts = [first]
+            if self.tts_provider != "google-cloud":
+                return texts, None
+            while True:
                 try:
-                    import subprocess
-                    subprocess.run(["ffplay", "-nodisp", "-autoexit", temp_mp3], 
-                                 check=True, 
-                                 stdout=subprocess.DEVNULL, 
-                                 stderr=subprocess.DEVNULL,
-                                 timeout=30)
-                except Exception as play_error:
-                    logger.warning(f"ffplay mojod nist ya kar nakard:\n{str(play_error)}")
-                    logger.info("baraye pakhsh sahih ffmpeg ra nasb konid: choco install ffmpeg")
-            finally:
-                if os.path.exists(temp_mp3):
-                    os.remove(temp_mp3)
-        else:
-            # برای Google Cloud که WAV است
-            temp_wav = os.path.join(self.temp_dir, "temp_speech.wav")
-            with open(temp_wav, "wb") as f:
-                f.write(audio_content)
-            
-            try:
-                data, samplerate = sf.read(temp_wav)
-                sd.play(data, samplerate)
-                sd.wait()
-            finally:
-                if os.path.exists(temp_wav):
-                    os.remove(temp_wav)
+                    nxt = await asyncio.wait_for(self.speaking_queue.get(), self.BATCH_WAIT_SECONDS)
+                except asyncio.TimeoutError:
+                    return texts, None
+                if nxt is _STOP or nxt in self._preloaded:
+                    return texts, nxt
+                # سقف API بر حسب بایت SSML نهایی است (فارسی در UTF-8 دو بایتی است)
+                if len(_build_ssml(texts + [nxt]).encode("utf-8")) > self.BATCH_MAX_BYTES:
+                    return texts, nxt
+                texts.append(nxt)
 
-    def _start_speaker_thread(self) -> None:
-        """راه‌اندازی thread مدیریت صف گفتار"""
-        def speaker_thread():
+        async def synthesize_stage() -> None:
+            carry: Any = None
             while True:
+                if carry is not None:
+                    text, carry = carry, None
+                else:
+                    text = await self.speaking_queue.get()
+                if text is _STOP:
+                    await self._audio_queue.put(_STOP)
+                    return
+                # عبارت از پیش آماده (یا در حال آماده‌سازی) دوباره سنتز نمی‌شود؛ اگر آماده‌سازی
+                # شکست خورده باشد (None) مانند متن عادی سنتز می‌شود
+                preload = self._preloaded.get(text)
+                decoded = await asyncio.wrap_future(preload) if preload is not None else None
+                count = 1
+                if decoded is None:
+                    texts, carry = await collect_batch(text)
+                    count = len(texts)
+                    try:
+                        content = await loop.run_in_executor(None, self._synthesize_batch, texts)
+                        decoded = await loop.run_in_executor(None, self._decode_audio, content)
+                    except Exception as e:
+                        logger.error(f"khata dar pokhsh goftar:\n{str(e)}")
+                await self._audio_queue.put((decoded, count))
+
+        async def play_stage() -> None:
+            while True:
+                item = await self._audio_queue.get()
+                if item is _STOP:
+                    self._mark_done(_STOP)
+                    return
+                decoded, count = item
                 try:
-                    text = self.speaking_queue.get()
-                    if text is None:  # سیگنال توقف
-                        break
-                    
-                    self.is_speaking = True
-                    audio_content = self._synthesize_speech(text)
-                    
-                    # تعیین فرمت صوتی بر اساس سرویس
-                    is_mp3 = self.tts_provider == "gtts"
-                    self._play_audio(audio_content, is_mp3=is_mp3)
+                    if decoded is not None:
+                        self.is_speaking = True
+                        await loop.run_in_executor(None, self._play_samples, *decoded)
                 except Exception as e:
                     logger.error(f"khata dar pokhsh goftar:\n{str(e)}")
                 finally:
                     self.is_speaking = False
-                    self.speaking_queue.task_done()
-        
-        self.speaker_thread = threading.Thread(target=speaker_thread, daemon=True)
-        self.speaker_thread.start()
+                    self._mark_done(item, count)
+
+        await asyncio.gather(synthesize_stage(), play_stage())
+
+    def _clear_queues(self) -> None:
+        """حذف متن‌ها و صداهای در انتظار (در thread حلقهٔ گفتار اجرا می‌شود)"""
+        for q in (self.speaking_queue, self._audio_queue):
+            while not q.empty():
+                item = q.get_nowait()
+                if item is _STOP:
+                    # سیگنال توقف نباید حذف شود؛ task_done نسخهٔ برداشته‌شده شمارش put دوباره را جبران می‌کند
+                    q.task_done()
+                    q.put_nowait(item)
+                    break
+                # شمارش کارهای ناتمام speaking_queue (برای speak(block=True)) هماهنگ می‌ماند
+                self._mark_done(item, item[1] if q is self._audio_queue else 1)
+
+    def _mark_done(self, item: Any, count: int = 1) -> None:
+        """اعلام پایان count مورد از صف گفتار (در thread حلقهٔ گفتار اجرا می‌شود)"""
+        if item is not _STOP:
+            with self._enqueue_lock:
+                self._pending -= count
+        for _ in range(count):
+            self.speaking_queue.task_done()
 
     def speak(self, text: str, block: bool = False) -> None:
         """تبدیل متن به گفتار
@@ -264,41 +774,56 @@ class VoiceOutput:
             text: متن برای تبدیل به گفتار
             block: اگر True باشد، منتظر اتمام گفتار می‌ماند
         """
+        text = (text or "").strip()
+        if not text:
+            return
         try:
-            self.speaking_queue.put(text)
+            with self._enqueue_lock:
+                # تکرار همان متنی که هنوز پخش آن تمام نشده، دوباره سنتز و پخش نمی‌شود
+                if text != self._last_enqueued or self._pending == 0:
+                    self._last_enqueued = text
+                    self._pending += 1
+                    self._loop.call_soon_threadsafe(self.speaking_queue.put_nowait, text)
             if block:
-                self.speaking_queue.join()
+                asyncio.run_coroutine_threadsafe(self.speaking_queue.join(), self._loop).result()
         except Exception as e:
             logger.error(f"khata dar afzoodan matn be saf goftar: {str(e)}")
 
     def stop_speaking(self) -> None:
         """توقف فوری گفتار فعلی و پاک‌سازی صف"""
-        with self.speaking_queue.mutex:
-            self.speaking_queue.queue.clear()
+        if self._loop.is_running():
+            self._loop.call_soon_threadsafe(self._clear_queues)
 
     def shutdown(self) -> None:
         """خاموش کردن موتور تبدیل متن به گفتار"""
         try:
-            self.speaking_queue.put(None)  # ارسال سیگنال توقف
+            self._loop.call_soon_threadsafe(self.speaking_queue.put_nowait, _STOP)  # ارسال سیگنال توقف
+            self._speaker_future.result()
+            self._loop.call_soon_threadsafe(self._loop.stop)
             self.speaker_thread.join()
-            if os.path.exists(self.temp_dir):
-                os.rmdir(self.temp_dir)
+            self._loop.close()
         except Exception as e:
             logger.error(f"khata dar khamosh kardan motor: {str(e)}")
 
 class VoiceManager:
     """مدیریت یکپارچه ورودی و خروجی صوتی"""
 
-    def __init__(self, tts_provider: Literal["google-cloud", "gtts"] = "google-cloud") -> None:
+    def __init__(self, tts_provider: Literal["google-cloud", "gtts"] = "google-cloud",
+                 stt_provider: Literal["google", "google-cloud"] = "google",
+                 preload_phrases: Sequence[str] = ()) -> None:
         """مقداردهی اولیه مدیر صوتی
         
         Args:
             tts_provider: انتخاب سرویس TTS
                 - "google-cloud": Google Cloud Text-to-Speech
                 - "gtts": gTTS رایگان
+            stt_provider: انتخاب سرویس STT
+                - "google": Google Web Speech رایگان
+                - "google-cloud": Google Cloud Speech-to-Text (استریم)
+            preload_phrases: عبارت‌های ثابت برای آماده‌سازی از پیش (به VoiceOutput داده می‌شود)
         """
-        self.voice_input = VoiceInput()
-        self.voice_output = VoiceOutput(tts_provider=tts_provider)
+        self.voice_input = VoiceInput(stt_provider=stt_provider)
+        self.voice_output = VoiceOutput(tts_provider=tts_provider, preload_phrases=preload_phrases)
 
     def listen(self, timeout: Optional[int] = None) -> str:
         """گوش دادن یک‌باره به ورودی صوتی
@@ -335,4 +860,5 @@ class VoiceManager:
     def shutdown(self) -> None:
         """بستن تمیز سیستم صوتی"""
         self.stop_conversation()
+        self.voice_input.shutdown()
         self.voice_output.shutdown()
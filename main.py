@@ -11,26 +11,42 @@ from __future__ import annotations
 
 import argparse
 import asyncio
+import functools
 import logging
+import re
 import shutil
 import sys
+import threading
 from pathlib import Path
-from typing import Optional
-from pyfiglet import Figlet
+from typing import TYPE_CHECKING, Optional
 from colorama import init as colorama_init, Fore, Style
 
 
 from core.agent_core import create_agent
 from core.memory_system import MemoryManager
-from core.task_engine import TaskEngine
-from core.voice_io import VoiceManager
+from core.task_engine import TaskEngine, uvloop_loop_factory
 from dotenv import load_dotenv
 from core.logging_config import setup_logging, install_exception_hook
 
+if TYPE_CHECKING:
+    from core.voice_io import VoiceManager
+
 colorama_init(autoreset=True) # در ویندوز، فعال کردن مدیریت ANSI
 with open('banner.txt', 'r', encoding='utf-8') as file:
     banner = file.read()
 
+# عبارت‌های ثابت گفتاری؛ همین فهرست به VoiceManager داده می‌شود تا هنگام راه‌اندازی از پیش آماده شوند
+_VOICE_WELCOME = "Hello! Welcome to the Artificial Intelligence System."
+_VOICE_ANOTHER_TASK = "Do you have another task? Say yes to add a new task or remain silent to continue."
+_VOICE_NO_TASKS = "No tasks have been added. Do you want to continue? If not, say no."
+_VOICE_MORE_TASKS = "Do you want to add or run more tasks? If not, say no."
+_VOICE_PROMPTS = (_VOICE_WELCOME, _VOICE_ANOTHER_TASK, _VOICE_NO_TASKS, _VOICE_MORE_TASKS)
+
+# پاسخ‌های بله/خیر در حالت صوتی (فارسی و انگلیسی)؛ کل پاسخ باید فقط همین کلمه باشد (با fullmatch)،
+# به همراه علامت پایانی احتمالی که سرویس تشخیص گفتار اضافه می‌کند
+_YES_RE = re.compile(r"\s*(?:بله|آره|yes|y)\s*[.!?؟]?\s*", re.IGNORECASE)
+_NO_RE = re.compile(r"\s*(?:نه|no|n)\s*[.!?؟]?\s*", re.IGNORECASE)
+
 # پیکربندی ثبت وقایع در هنگام راه‌اندازی اولیه تنظیم می‌شود (به `setup_logging` مراجعه کنید)
 logger = logging.getLogger(__name__)
 
@@ -81,34 +97,72 @@ def parse_arguments() -> argparse.Namespace:
         default="gtts",
         help="انتخاب سرویس تبدیل متن به گفتار: 'google-cloud' (پولی، کیفیت بالا) یا 'gtts' (رایگان)"
     )
+    parser.add_argument(
+        "--stt-provider",
+        choices=["google", "google-cloud"],
+        default="google",
+        help="انتخاب سرویس تبدیل گفتار به متن: 'google' (رایگان) یا 'google-cloud' (استریم، پولی)"
+    )
 
     return parser.parse_args()
 
+@functools.lru_cache(maxsize=4)
+def _render_banner(text: str, color: str, term_width: int) -> str:
+    """ساخت رشتهٔ کامل بنر (رنگی و وسط‌چین) برای یک عرض ترمینال مشخص."""
+    # اگر متن از قبل ASCII art است، فقط هر خط وسط‌چین می‌شود
+    return "".join(
+        color + " " * max(0, (term_width - len(line)) // 2) + line + Style.RESET_ALL + "\n"
+        for line in text.splitlines()
+    )
+
 def print_banner(text=banner, color=Fore.CYAN) -> None:
     """چاپ بنر خوش‌آمدگویی در CLI."""
     term_width = shutil.get_terminal_size((80, 20)).columns
     
     try:
-        # اگر متن از قبل ASCII art است، مستقیماً آن را نمایش می‌دهیم
-        lines = str(text).splitlines()
-        for line in lines:
-            # محاسبه فاصله لازم برای مرکز قرار دادن متن
-            padding = (term_width - len(line)) // 2
-            if padding > 0:
-                print(color + " " * padding + line + Style.RESET_ALL)
-            else:
-                print(color + line + Style.RESET_ALL)
+        # کل بنر با یک write نوشته می‌شود؛ رشتهٔ آماده برای هر عرض ترمینال کش می‌شود
+        sys.stdout.write(_render_banner(str(text), color, term_width))
+        sys.stdout.flush()
     except Exception as e:
         logger.error(f"Khata dar Namayeshe Banner: {str(e)}")
         print(color + str(text) + Style.RESET_ALL)
 
-async def process_user_input(task_engine: TaskEngine, memory: MemoryManager, mode: str, input_mode: str, voice: VoiceManager) -> None:
+async def _ainput(prompt: str) -> str:
+    """input() بدون مسدود کردن حلقهٔ asyncio (تا مثلاً cleaner مربوط به AgentPool بین پرسش‌ها اجرا شود).
+
+    خواندن در یک thread از نوع daemon انجام می‌شود تا input معلق هنگام خروج برنامه مانع بسته شدن نشود.
+    """
+    loop = asyncio.get_running_loop()
+    future: asyncio.Future[str] = loop.create_future()
+
+    def _settle(line: Optional[str], exc: Optional[BaseException]) -> None:
+        if future.done():
+            return
+        if exc is not None:
+            future.set_exception(exc)
+        else:
+            future.set_result(line or "")
+
+    def _read() -> None:
+        try:
+            line, exc = input(prompt), None
+        except (EOFError, OSError) as e:
+            line, exc = None, e
+        try:
+            loop.call_soon_threadsafe(_settle, line, exc)
+        except RuntimeError:
+            pass  # حلقه پیش از پایان خواندن بسته شده است
+
+    threading.Thread(target=_read, name="stdin-reader", daemon=True).start()
+    return await future
+
+async def process_user_input(task_engine: TaskEngine, memory: MemoryManager, mode: str, input_mode: str, voice: Optional[VoiceManager]) -> None:
     """پردازش ورودی کاربر در یک حلقه تعاملی."""
 
     print_banner(banner, color=Fore.CYAN)
     # خوش‌آمدگویی صوتی اگر حالت voice انتخاب شده باشد
     if input_mode == "voice":
-        voice.speak("Hello! Welcome to the Artificial Intelligence System.", block=True)
+        voice.speak(_VOICE_WELCOME, block=True)
     print("\n Be Systeme Narm Afzarie Hooshe Masnoee Sofware-AI Khosh Amadid !")
     print("Task haaye khod ra vared konid (har task dar yek khat). Baraye khorooj az Ctrl+C estefade konid.\n")
 
@@ -120,12 +174,12 @@ async def process_user_input(task_engine: TaskEngine, memory: MemoryManager, mod
                 try:
 
                     if input_mode == "voice":
-                        user_input = voice.listen(timeout=7)
+                        user_input = await asyncio.to_thread(voice.listen, timeout=7)
                         if not user_input:
                             print("verodi soti daryaft neshod, lotfan dobareh talash konid.")
                             continue
                     else:
-                        user_input = input("Taske Jadid > ").strip()
+                        user_input = (await _ainput("Taske Jadid > ")).strip()
                         if not user_input:
                             continue
 
@@ -143,14 +197,14 @@ async def process_user_input(task_engine: TaskEngine, memory: MemoryManager, mod
                     # پرسش برای افزودن تسک بیشتر یا شروع اجرا
 
                     if input_mode == "voice":
-                        voice.speak("Do you have another task? Say yes to add a new task or remain silent to continue.")
-                        choice = voice.listen(timeout=5)
-                        if choice and ("بله" in choice or "yes" in choice.lower()):
+                        voice.speak(_VOICE_ANOTHER_TASK)
+                        choice = await asyncio.to_thread(voice.listen, timeout=5)
+                        if choice and _YES_RE.fullmatch(choice):
                             continue
                         else:
                             break
                     else:
-                        choice = input("\n Aya task digari darid? (y/N) ").strip().lower()
+                        choice = (await _ainput("\n Aya task digari darid? (y/N) ")).strip().lower()
                         if choice == 'y':
                             continue
                         else:
@@ -163,14 +217,14 @@ async def process_user_input(task_engine: TaskEngine, memory: MemoryManager, mod
 
             if not task_engine.queue:
                 if input_mode == "voice":
-                    voice.speak("No tasks have been added. Do you want to continue? If not, say no.")
-                    cont = voice.listen(timeout=5)
-                    if cont and ("نه" in cont or "no" in cont.lower()):
+                    voice.speak(_VOICE_NO_TASKS)
+                    cont = await asyncio.to_thread(voice.listen, timeout=5)
+                    if cont and _NO_RE.fullmatch(cont):
                         break
                     else:
                         continue
                 else:
-                    cont = input("\n Hich taski ezafe nashode ast. Aya mikhahid edame dahid? (Y/n) ").strip().lower()
+                    cont = (await _ainput("\n Hich taski ezafe nashode ast. Aya mikhahid edame dahid? (Y/n) ")).strip().lower()
                     if cont == 'n':
                         break
                     else:
@@ -204,24 +258,27 @@ async def process_user_input(task_engine: TaskEngine, memory: MemoryManager, mod
             # بپرسید که آیا کاربر می‌خواهد وظایف بیشتری اضافه کند یا اجرا کند
 
             if input_mode == "voice":
-                voice.speak("Do you want to add or run more tasks? If not, say no.")
-                cont = voice.listen(timeout=5)
-                if cont and ("نه" in cont or "no" in cont.lower()):
+                voice.speak(_VOICE_MORE_TASKS)
+                cont = await asyncio.to_thread(voice.listen, timeout=5)
+                if cont and _NO_RE.fullmatch(cont):
                     break
                 else:
                     continue
             else:
-                cont = input("\n Aya mikhahid task haye bishtari ezafe konid ya anjam dahid? (Y/n) ").strip().lower()
+                cont = (await _ainput("\n Aya mikhahid task haye bishtari ezafe konid ya anjam dahid? (Y/n) ")).strip().lower()
                 if cont == 'n':
                     break
                 else:
                     continue
 
-    except KeyboardInterrupt:
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        # با asyncio.Runner، Ctrl+C در حین انتظار برای ورودی به صورت لغو (cancel) همین task می‌رسد
         print("\nDar hal khamosh shodan narm-afzar...")
     finally:
+        await task_engine.close()
         memory.shutdown()
-        voice.shutdown()
+        if voice is not None:
+            voice.shutdown()
 
 async def main() -> None:
     """نقطه ورود اصلی برنامه."""
@@ -239,7 +296,13 @@ async def main() -> None:
         # راه‌اندازی اجزای اصلی
         task_engine = TaskEngine(concurrency=args.concurrency)
         memory = MemoryManager()
-        voice = VoiceManager(tts_provider=args.tts_provider)
+        # ماژول صوتی (و کتابخانه‌های سنگین آن) فقط در حالت voice بارگذاری می‌شود
+        voice: Optional[VoiceManager] = None
+        if args.input_mode == "voice":
+            from core.voice_io import VoiceManager
+
+            voice = VoiceManager(tts_provider=args.tts_provider, stt_provider=args.stt_provider,
+                                 preload_phrases=_VOICE_PROMPTS)
 
         # پردازش ورودی کاربر و اجرای تسک‌ها
         await process_user_input(task_engine, memory, args.mode, args.input_mode, voice)
@@ -249,4 +312,6 @@ async def main() -> None:
         sys.exit(1)
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    # uvloop اختیاری است و فقط با TASKENGINE_UVLOOP=1 در محیط فعال می‌شود (پیش از بارگذاری .env)
+    with asyncio.Runner(loop_factory=uvloop_loop_factory()) as runner:
+        runner.run(main())
\ No newline at end of file